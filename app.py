@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import glob
 from pathlib import Path
 import google.generativeai as genai
@@ -71,7 +72,7 @@ def load_cost_basis():
         df.columns = [str(c).replace("﻿", "").strip() for c in df.columns]
         df["股數"] = pd.to_numeric(df.get("股數", 0), errors="coerce").fillna(0).astype(int)
         df["成本市值"] = pd.to_numeric(df.get("成本市值", 0), errors="coerce").fillna(0.0)
-        return df[df["股數"] > 0].copy()
+        return df[df["股數"] > 0]  # st.cache_data 回傳時本就給副本
     except Exception:
         return pd.DataFrame()
 
@@ -225,20 +226,22 @@ with tab_cost:
 
         st.write("#### 個股成本明細（依成本市值由大到小）")
 
-        def _color_pnl(val):
-            if pd.isna(val) or val == 0:
-                return ""
-            return "color: #16a34a; font-weight:600" if val > 0 else "color: #dc2626; font-weight:600"
+        def _color_pnl(block):
+            # 整塊一次判斷正負（NaN 比較皆為 False → 不上色），不逐格呼叫
+            v = block.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+            css = np.where(v > 0, "color: #16a34a; font-weight:600",
+                           np.where(v < 0, "color: #dc2626; font-weight:600", ""))
+            return pd.DataFrame(css, index=block.index, columns=block.columns)
 
         show_cols = ["股票代號", "股票名稱", "股數", "平均成本(元)",
                      "成本市值", "今日收盤價", "今日市值(元)", "浮動損益(元)", "報酬率"]
         df_show = df_display[show_cols].sort_values("成本市值", ascending=False).reset_index(drop=True)
 
-        styled = df_show.style.applymap(_color_pnl, subset=["浮動損益(元)", "報酬率"])
+        styled = df_show.style.apply(_color_pnl, axis=None, subset=["浮動損益(元)", "報酬率"])
         st.dataframe(styled, use_container_width=True)
 
         # 損益長條圖
-        valid_pnl = df_display.dropna(subset=["浮動損益(元)"]).copy()
+        valid_pnl = df_display.dropna(subset=["浮動損益(元)"])  # 只讀，不需複製
         if not valid_pnl.empty:
             st.write("#### 個股浮動損益排行")
             chart_df = valid_pnl.set_index("股票代號")[["浮動損益(元)"]].sort_values("浮動損益(元)")
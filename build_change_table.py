@@ -1,11 +1,19 @@
 # build_change_table.py — 以 data/REPORT_DATE.csv 與 data_snapshots 中「報告日前最後一筆」比較
 # 產出：reports/ 內的表格與摘要（此檔只負責資料計算與輸出 CSV/MD，由你的寄信程式再組信）
-import os, glob
+import os, re, glob, hashlib, json
+from functools import lru_cache
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+from config import PCT_DECIMALS
+from utils import row_text
+
 OUT_DIR = Path("reports")
 OUT_DIR.mkdir(exist_ok=True, parents=True)
+# 各報告日的輸入簽章（同 charts/.manifest.json：隨 reports/ 一起進版控，CI 重新 checkout 後仍可判斷跳過）
+MANIFEST = OUT_DIR / ".manifest.json"
+CODE_RE = re.compile(r"([1-9]\d{3})")  # 僅接受 1000-9999；各處 str.extract 共用
 
 def _report_date() -> str:
     d = (os.getenv("REPORT_DATE") or "").strip()
@@ -25,13 +33,12 @@ def _load_df(path: Path) -> pd.DataFrame:
     if rename: df.rename(columns=rename, inplace=True)
     if "股票代號" not in df.columns:
         # 從名稱嘗試抓 4 碼
-        import re
         if "股票名稱" in df.columns:
-            df["股票代號"] = df["股票名稱"].astype(str).str.extract(r"([1-9]\d{3})", expand=False)
+            df["股票代號"] = df["股票名稱"].astype(str).str.extract(CODE_RE, expand=False)
         else:
-            any_text = df.astype(str).agg(" ".join, axis=1)
-            df["股票代號"] = any_text.str.extract(r"([1-9]\d{3})", expand=False)
-    df["股票代號"] = df["股票代號"].astype(str).str.extract(r"([1-9]\d{3})", expand=False)
+            any_text = row_text(df)
+            df["股票代號"] = any_text.str.extract(CODE_RE, expand=False)
+    df["股票代號"] = df["股票代號"].astype(str).str.extract(CODE_RE, expand=False)
     df = df.dropna(subset=["股票代號"])
     if "股票名稱" not in df.columns: df["股票名稱"] = ""
     if "股數" not in df.columns: df["股數"] = 0
@@ -46,8 +53,43 @@ def _load_df(path: Path) -> pd.DataFrame:
     df = df[["股票代號","股票名稱","股數","持股權重"]].drop_duplicates("股票代號")
     return df.sort_values("股票代號").reset_index(drop=True)
 
+def _file_sha256(path: Path) -> str:
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+（OpenSSL 直接吃檔案）
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+        return h.hexdigest()
+
+def _input_signature(report_date: str, paths) -> str:
+    """報告日 + 各輸入檔（含本程式）的 sha256 合成一個簽章；檔案不存在記為 '-'"""
+    lines = [report_date]
+    for p in paths:
+        lines.append(f"{p.as_posix()}:{_file_sha256(p) if p.exists() else '-'}")
+    return hashlib.sha256(("\n".join(lines) + "\n").encode("utf-8")).hexdigest()
+
+def _load_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _record_manifest(report_date: str, sig: str):
+    m = _load_manifest()
+    m[report_date] = sig
+    MANIFEST.write_text(json.dumps(m, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+
+@lru_cache(maxsize=4)
+def _snapshot_list(dir_mtime_ns: int) -> tuple:
+    # 以目錄 mtime 為 key：新增/刪除快照會改變 mtime，自動失效
+    return tuple(sorted(glob.glob("data_snapshots/*.csv")))
+
 def _find_prev_snapshot(report_date: str) -> Path:
-    snaps = sorted(glob.glob("data_snapshots/*.csv"))
+    try:
+        snaps = _snapshot_list(os.stat("data_snapshots").st_mtime_ns)
+    except FileNotFoundError:
+        snaps = ()
     prev_path = None
     for p in reversed(snaps):
         name = Path(p).stem  # YYYY-MM-DD
@@ -57,14 +99,11 @@ def _find_prev_snapshot(report_date: str) -> Path:
         raise RuntimeError(f"找不到 {report_date} 之前的可用 CSV 作為比較基期（於 data_snapshots）")
     return prev_path
 
-def _load_prices(report_date: str) -> pd.DataFrame:
-    """從 prices/ 目錄讀取今日收盤價（及可能的昨日收盤價）"""
-    prices_today = Path("prices") / f"{report_date}.csv"
-    if not prices_today.exists():
-        print(f"[警告] 找不到今日價格檔 {prices_today}，收盤價欄位將為空")
-        return pd.DataFrame(columns=["股票代號", "今日收盤價"])
-    
-    df_price = pd.read_csv(prices_today, encoding="utf-8-sig")
+@lru_cache(maxsize=16)
+def _read_price_file(path: Path):
+    """prices/ 單日價格檔 → [股票代號, 收盤價]；欄位不符回傳 None。
+    同一 process 內重複呼叫 main()（例如逐日補跑）時，前一日的「今日價」即下一日的「昨日價」，只解析一次。"""
+    df_price = pd.read_csv(path, encoding="utf-8-sig")
     # 標準化欄位名稱
     rename_map = {}
     for col in df_price.columns:
@@ -72,22 +111,34 @@ def _load_prices(report_date: str) -> pd.DataFrame:
         if any(k in col_str for k in ["股票代號", "證券代號", "代號", "代碼"]):
             rename_map[col] = "股票代號"
         elif any(k in col_str for k in ["收盤價", "收盤", "close", "Close"]):
-            rename_map[col] = "今日收盤價"
+            rename_map[col] = "收盤價"
     
     if rename_map:
         df_price.rename(columns=rename_map, inplace=True)
     
     # 確保必要欄位存在
-    if "股票代號" not in df_price.columns or "今日收盤價" not in df_price.columns:
-        print(f"[警告] 價格檔欄位不符，需包含股票代號與收盤價")
-        return pd.DataFrame(columns=["股票代號", "今日收盤價"])
+    if "股票代號" not in df_price.columns or "收盤價" not in df_price.columns:
+        return None
     
     # 清理資料
-    df_price["股票代號"] = df_price["股票代號"].astype(str).str.extract(r"([1-9]\d{3})", expand=False)
+    df_price["股票代號"] = df_price["股票代號"].astype(str).str.extract(CODE_RE, expand=False)
     df_price = df_price.dropna(subset=["股票代號"])
-    df_price["今日收盤價"] = pd.to_numeric(df_price["今日收盤價"], errors="coerce")
+    df_price["收盤價"] = pd.to_numeric(df_price["收盤價"], errors="coerce")
+    
+    return df_price[["股票代號", "收盤價"]].drop_duplicates("股票代號")
+
+def _load_prices(report_date: str) -> pd.DataFrame:
+    """從 prices/ 目錄讀取今日收盤價（及可能的昨日收盤價）"""
+    prices_today = Path("prices") / f"{report_date}.csv"
+    if not prices_today.exists():
+        print(f"[警告] 找不到今日價格檔 {prices_today}，收盤價欄位將為空")
+        return pd.DataFrame(columns=["股票代號", "今日收盤價"])
     
-    return df_price[["股票代號", "今日收盤價"]].drop_duplicates("股票代號")
+    df_price = _read_price_file(prices_today)
+    if df_price is None:
+        print(f"[警告] 價格檔欄位不符，需包含股票代號與收盤價")
+        return pd.DataFrame(columns=["股票代號", "今日收盤價"])
+    return df_price.rename(columns={"收盤價": "今日收盤價"})
 
 def _load_prices_yesterday(prev_date: str) -> pd.DataFrame:
     """從 prices/ 目錄讀取昨日收盤價（選配）"""
@@ -95,29 +146,10 @@ def _load_prices_yesterday(prev_date: str) -> pd.DataFrame:
     if not prices_yesterday.exists():
         return pd.DataFrame(columns=["股票代號", "昨日收盤價"])
     
-    df_price = pd.read_csv(prices_yesterday, encoding="utf-8-sig")
-    # 標準化欄位名稱
-    rename_map = {}
-    for col in df_price.columns:
-        col_str = str(col)
-        if any(k in col_str for k in ["股票代號", "證券代號", "代號", "代碼"]):
-            rename_map[col] = "股票代號"
-        elif any(k in col_str for k in ["收盤價", "收盤", "close", "Close"]):
-            rename_map[col] = "昨日收盤價"
-    
-    if rename_map:
-        df_price.rename(columns=rename_map, inplace=True)
-    
-    # 確保必要欄位存在
-    if "股票代號" not in df_price.columns or "昨日收盤價" not in df_price.columns:
+    df_price = _read_price_file(prices_yesterday)
+    if df_price is None:
         return pd.DataFrame(columns=["股票代號", "昨日收盤價"])
-    
-    # 清理資料
-    df_price["股票代號"] = df_price["股票代號"].astype(str).str.extract(r"([1-9]\d{3})", expand=False)
-    df_price = df_price.dropna(subset=["股票代號"])
-    df_price["昨日收盤價"] = pd.to_numeric(df_price["昨日收盤價"], errors="coerce")
-    
-    return df_price[["股票代號", "昨日收盤價"]].drop_duplicates("股票代號")
+    return df_price.rename(columns={"收盤價": "昨日收盤價"})
 
 def main():
     report_date = _report_date()
@@ -130,20 +162,38 @@ def main():
     
     prev_csv = _find_prev_snapshot(report_date)
     prev_date = prev_csv.stem  # 取得昨日日期 YYYY-MM-DD
+    out_csv = OUT_DIR / f"change_table_{report_date}.csv"
+
+    # 輸入與該報告日上次產出時完全相同（例如 workflow 重跑）且輸出還在 → 直接跳過；FORCE_REBUILD=1 強制重算
+    sig = _input_signature(report_date, [
+        today_csv, prev_csv,
+        Path("prices") / f"{report_date}.csv", Path("prices") / f"{prev_date}.csv",
+        Path(os.path.relpath(__file__)),
+    ])
+    force = os.getenv("FORCE_REBUILD", "").strip() in ("1", "true", "yes")
+    if not force and out_csv.exists() and _load_manifest().get(report_date) == sig:
+        print(f"[build] inputs unchanged; skipping {out_csv}")
+        return
     
     df_t = _load_df(today_csv).rename(columns={"股數":"今日股數","持股權重":"今日權重%"})
     df_y = _load_df(prev_csv).rename(columns={"股數":"昨日股數","持股權重":"昨日權重%"})
     
-    df = pd.merge(df_t, df_y, on=["股票代號"], how="outer")
+    # 兩邊代號皆已唯一且排序：以 index 對齊做 outer join（走單調 index 快速路徑，不建 hash join）
+    df = df_t.set_index("股票代號").join(df_y.set_index("股票代號"), how="outer",
+                                         lsuffix="_x", rsuffix="_y").reset_index()
     df["股票名稱"] = df["股票名稱_x"].fillna(df["股票名稱_y"]).fillna("")
     df.drop(columns=["股票名稱_x","股票名稱_y"], inplace=True)
     
-    for col in ["今日股數","昨日股數","今日權重%","昨日權重%"]:
+    num_cols = ["今日股數","昨日股數","今日權重%","昨日權重%"]
+    for col in num_cols:
         if col not in df.columns: df[col] = 0
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
     
-    df["買賣超股數"] = (df["今日股數"] - df["昨日股數"]).astype(int)
-    df["權重Δ%"]   = (df["今日權重%"] - df["昨日權重%"]).round(2)
+    # 四欄一次取成連續 float 矩陣，兩個差值同一次相減，權重Δ% 只做一次 round
+    arr = df[num_cols].to_numpy(dtype=float)
+    diff = arr[:, [0, 2]] - arr[:, [1, 3]]
+    df["買賣超股數"] = diff[:, 0].astype(int)
+    df["權重Δ%"]   = np.round(diff[:, 1], PCT_DECIMALS)
     df["首次買進"] = (df["昨日股數"]==0) & (df["今日股數"]>0)
     df["關鍵賣出"] = (df["昨日股數"]>0) & (df["今日股數"]==0)
     
@@ -162,8 +212,8 @@ def main():
         df["昨日收盤價"] = None
     
     # 輸出結果
-    out_csv = OUT_DIR / f"change_table_{report_date}.csv"
     df.to_csv(out_csv, index=False, encoding="utf-8-sig")
+    _record_manifest(report_date, sig)
     print(f"[build] saved {out_csv}  rows={len(df)}")
 
 if __name__ == "__main__":
@@ -1,12 +1,22 @@
 # build_prices.py — 產出 prices/YYYY-MM-DD.csv（TWSE/TPEx 優先，缺的用 Yahoo 補）
-import os, re, glob, time, json
+import os, re, glob, json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
 import pandas as pd
-import requests
+
+from utils import make_session
+
+try:
+    import orjson  # 選配：全市場 MI_INDEX 回應動輒數 MB，orjson 解析快很多
+except ImportError:
+    orjson = None
 
 DATA_DIR   = Path("data")
 PRICE_DIR  = Path("prices"); PRICE_DIR.mkdir(parents=True, exist_ok=True)
+ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+YMD_RE      = re.compile(r"\d{8}")
+CODE4_RE    = re.compile(r"\d{4}")  # 全市場表逐列比對，預先編譯
 
 TWSE_API_1 = "https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX?date={date}&type=ALLBUT0999&response=json"
 TWSE_API_2 = "https://www.twse.com.tw/exchangeReport/MI_INDEX?response=json&date={date}&type=ALLBUT0999"
@@ -15,14 +25,25 @@ TPEx_API   = "https://www.tpex.org.tw/www/stock/exchange_report/MI_INDEX?respons
 HEADERS = {
     "User-Agent":"Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124 Safari/537.36"
 }
+# 共用 Session：TWSE 兩個端點同主機可重用連線；暫時性錯誤（429/5xx）自動退避重試
+SESSION = make_session(HEADERS)
 
 def _norm_date(raw: str) -> str:
     s = (raw or "").strip()
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", s): return s
-    if re.fullmatch(r"\d{8}", s): return f"{s[:4]}-{s[4:6]}-{s[6:]}"
+    if ISO_DATE_RE.fullmatch(s): return s
+    if YMD_RE.fullmatch(s): return f"{s[:4]}-{s[4:6]}-{s[6:]}"
     # 預設今天（由 workflow 設 TZ=Asia/Taipei）
     return datetime.now().strftime("%Y-%m-%d")
 
+def _get_json(url: str):
+    r = SESSION.get(url, timeout=30)
+    if orjson is not None:
+        try:
+            return orjson.loads(r.content)
+        except orjson.JSONDecodeError:
+            pass  # 非 UTF-8 等情況交回 requests 處理
+    return r.json()
+
 def _clean_price(x):
     if pd.isna(x): return None
     s = str(x).replace(",", "").replace("--", "").strip()
@@ -46,21 +67,24 @@ def _extract_code_price_from_table(headers, rows):
     if code_idx is None or price_idx is None:
         return pd.DataFrame(columns=["股票代號","收盤價"])
 
+    # 先以代號格式過濾（ETF/權證等非 4 碼列不必清洗價格），只對有效列呼叫 _clean_price
     out = []
     for r in rows:
         try:
             code = str(r[code_idx]).strip()
+            if not CODE4_RE.fullmatch(code):
+                continue
             price = _clean_price(r[price_idx])
-            if code and re.fullmatch(r"\d{4}", code) and price is not None:
-                out.append((code, price))
         except:
             continue
+        if price is not None:
+            out.append((code, price))
     return pd.DataFrame(out, columns=["股票代號","收盤價"])
 
 def _fetch_twse(date_yyyymmdd: str) -> pd.DataFrame:
     # 嘗試新版 rwd
     try:
-        j = requests.get(TWSE_API_1.format(date=date_yyyymmdd), headers=HEADERS, timeout=30).json()
+        j = _get_json(TWSE_API_1.format(date=date_yyyymmdd))
         if "tables" in j:
             for t in j["tables"]:
                 headers = t.get("fields") or t.get("columns") or []
@@ -73,7 +97,7 @@ def _fetch_twse(date_yyyymmdd: str) -> pd.DataFrame:
 
     # 回退舊版 exchangeReport
     try:
-        j = requests.get(TWSE_API_2.format(date=date_yyyymmdd), headers=HEADERS, timeout=30).json()
+        j = _get_json(TWSE_API_2.format(date=date_yyyymmdd))
         # 這個版本會有 data9/fields9 或 dataX/fieldsX
         for k in list(j.keys()):
             if k.startswith("fields"):
@@ -89,7 +113,7 @@ def _fetch_twse(date_yyyymmdd: str) -> pd.DataFrame:
 
 def _fetch_tpex(date_yyyymmdd: str) -> pd.DataFrame:
     try:
-        j = requests.get(TPEx_API.format(date=date_yyyymmdd), headers=HEADERS, timeout=30).json()
+        j = _get_json(TPEx_API.format(date=date_yyyymmdd))
         # 可能的形狀：tables[] / aaData / data
         if "tables" in j:
             for t in j["tables"]:
@@ -113,8 +137,20 @@ def _fetch_tpex(date_yyyymmdd: str) -> pd.DataFrame:
         print("[tpex] fail:", e)
     return pd.DataFrame(columns=["股票代號","收盤價"])
 
+def _yahoo_closes(yf, tickers, date_str, end):
+    """一次下載多檔，回傳 {ticker: close}；查無或 NaN 者略過"""
+    df = yf.download(tickers, start=date_str, end=end, interval="1d", progress=False,
+                     auto_adjust=False, threads=True, group_by="column")
+    if not isinstance(df, pd.DataFrame) or df.empty or "Close" not in df.columns:
+        return {}
+    close = df["Close"]
+    if isinstance(close, pd.Series):  # 舊版 yfinance 單檔時欄位不分層
+        close = close.to_frame(tickers[0])
+    last = close.iloc[-1]
+    return {t: float(v) for t, v in last.items() if v and v == v}  # not NaN
+
 def _fetch_yahoo(codes, date_str):
-    """逐檔嘗試 Yahoo（.TW -> .TWO），回傳 DataFrame(code, close)"""
+    """Yahoo 批次補價（先整批 .TW，查無者再整批 .TWO），回傳 DataFrame(code, close)"""
     try:
         import yfinance as yf
     except Exception:
@@ -124,22 +160,18 @@ def _fetch_yahoo(codes, date_str):
     start = pd.to_datetime(date_str)
     end   = (start + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
 
-    out = []
-    for code in codes:
-        close = None
-        for suf in [".TW", ".TWO"]:
-            try:
-                df = yf.download(code + suf, start=date_str, end=end, interval="1d", progress=False, auto_adjust=False, threads=False)
-                if isinstance(df, pd.DataFrame) and not df.empty and "Close" in df.columns:
-                    v = float(df["Close"].iloc[-1])
-                    if v and v == v:  # not NaN
-                        close = v; break
-            except Exception as e:
-                print(f"[yahoo] {code}{suf} fail:", e)
-                time.sleep(0.5)
-        if close is not None:
-            out.append((code, close))
-    return pd.DataFrame(out, columns=["股票代號","收盤價"])
+    got = {}
+    for suf in [".TW", ".TWO"]:
+        todo = [c for c in codes if c not in got]
+        if not todo: break
+        try:
+            closes = _yahoo_closes(yf, [c + suf for c in todo], date_str, end)
+        except Exception as e:
+            print(f"[yahoo] {suf} batch fail:", e)
+            continue
+        for c in todo:
+            if c + suf in closes: got[c] = closes[c + suf]
+    return pd.DataFrame([(c, got[c]) for c in codes if c in got], columns=["股票代號","收盤價"])
 
 def main():
     date_str = _norm_date(os.getenv("REPORT_DATE"))
@@ -149,11 +181,16 @@ def main():
         raise SystemExit(f"找不到當日持股 CSV：{src}")
 
     # 代號清單（字串）
-    codes = pd.read_csv(src, encoding="utf-8-sig")["股票代號"].astype(str).str.strip().unique().tolist()
-
-    twse = _fetch_twse(yyyymmdd)
-    tpex = _fetch_tpex(yyyymmdd)
-    px = pd.concat([twse, tpex], ignore_index=True).drop_duplicates("股票代號")
+    codes = pd.read_csv(src, encoding="utf-8-sig", usecols=["股票代號"], dtype=str)["股票代號"].str.strip().unique().tolist()
+
+    # 上市、上櫃全市場表彼此獨立（不同主機）：併發下載，等待時間重疊
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_twse = ex.submit(_fetch_twse, yyyymmdd)
+        f_tpex = ex.submit(_fetch_tpex, yyyymmdd)
+        twse, tpex = f_twse.result(), f_tpex.result()
+    # 全市場上千列：先只留持股代號再去重，不必整表 drop_duplicates
+    px = pd.concat([twse, tpex], ignore_index=True)
+    px = px[px["股票代號"].isin(codes)].drop_duplicates("股票代號")
 
     # Yahoo 補齊缺的
     miss = sorted(set(codes) - set(px["股票代號"].tolist()))
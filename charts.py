@@ -1,61 +1,72 @@
 # charts.py — 以 reports/change_table_{REPORT_DATE}.csv 繪圖
+import hashlib
+import io
+import json
 import os
 from pathlib import Path
-import glob
+import numpy as np
 import pandas as pd
 import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-
-plt.rcParams["font.sans-serif"] = ["Microsoft JhengHei", "PingFang TC", "Noto Sans CJK TC", "Arial"]
-plt.rcParams["axes.unicode_minus"] = False
-
-def get_report_date() -> str:
-    p = Path("manifest/effective_date.txt")
-    if p.exists():
-        d = p.read_text(encoding="utf-8").strip()
-        if d:
-            return d
-    d = (os.getenv("REPORT_DATE") or "").strip()
-    if len(d) == 8 and d.isdigit():
-        return f"{d[:4]}-{d[4:6]}-{d[6:]}"
-    return d
-
-def find_prev_snapshot(report_date: str) -> str:
-    snaps = sorted(glob.glob("data_snapshots/*.csv"))
-    prev = ""
-    for p in reversed(snaps):
-        name = Path(p).stem
-        if name < report_date:
-            prev = name
-            break
-    return prev
+from matplotlib import font_manager
+from matplotlib.figure import Figure
+
+from utils import find_prev_snapshot, get_report_date
+
+# 只放本機實際裝有的字型：清單中找不到的字型每畫一段文字都會重新 fallback 查找並噴警告
+_CJK_FONTS = ["Microsoft JhengHei", "PingFang TC", "Noto Sans CJK TC", "Arial"]
+_installed = {f.name for f in font_manager.fontManager.ttflist}
+matplotlib.rcParams["font.sans-serif"] = [f for f in _CJK_FONTS if f in _installed] + matplotlib.rcParams["font.sans-serif"]
+matplotlib.rcParams["axes.unicode_minus"] = False
+# 輸出加速：路徑分段送進 Agg、PNG 用低壓縮等級（像素不變，只差檔案大小）
+matplotlib.rcParams["path.simplify"] = True
+matplotlib.rcParams["agg.path.chunksize"] = 10000
+PNG_KW = {"compress_level": 1}
 
 def save(fig, out):
+    # 先編碼到記憶體，再一次 write 落檔（PNG encoder 逐 chunk 小量寫入的 syscall 合併成一次）
     Path("charts").mkdir(exist_ok=True)
-    fig.savefig(out, bbox_inches="tight", dpi=150)
-    plt.close(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=150, pil_kwargs=PNG_KW)
+    Path(out).write_bytes(buf.getbuffer())
 
-def main():
-    date = get_report_date()
-    if not date:
-        raise SystemExit("REPORT_DATE 未設定")
+MANIFEST = Path("charts/.manifest.json")
 
-    change_csv = Path("reports")/f"change_table_{date}.csv"
-    if not change_csv.exists():
-        raise SystemExit(f"缺少 {change_csv}")
+def inputs_digest(inputs) -> str:
+    # 以輸入檔「內容」雜湊（不看 mtime：CI 每次 checkout mtime 都會變）
+    h = hashlib.blake2b(digest_size=16)
+    for i in inputs:
+        p = Path(i)
+        h.update(p.name.encode())
+        h.update(p.read_bytes() if p.exists() else b"\0")
+    return h.hexdigest()
 
-    df = pd.read_csv(change_csv, encoding="utf-8-sig")
-    prev_date = find_prev_snapshot(date) or "N/A"
+def load_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
 
-    # D1 Top Movers（依 Δ% 絕對值排序，僅代號作 y 標籤）
-    d1 = df.copy()
-    d1["absΔ"] = d1["權重Δ%"].abs()
-    d1 = d1.sort_values("absΔ", ascending=False).head(20)
-    codes = d1["股票代號"].astype(str).tolist()
-    vals  = d1["權重Δ%"].tolist()
+def up_to_date(outs, date, digest) -> bool:
+    # 輸出圖都在且輸入內容雜湊與上次相同 → 可跳過；FORCE_REBUILD=1 強制重畫
+    if os.getenv("FORCE_REBUILD", "").strip() in ("1", "true", "yes"):
+        return False
+    if not all(Path(o).exists() for o in outs):
+        return False
+    return load_manifest().get(date) == digest
+
+def record_manifest(date, digest):
+    m = load_manifest()
+    m[date] = digest
+    MANIFEST.write_text(json.dumps(m, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
 
-    fig, ax = plt.subplots(figsize=(10,6))
+def fresh_ax(fig):
+    # 三張圖共用同一個 Figure：每張圖前清空重畫，不重建 figure/canvas
+    fig.clf()
+    return fig.add_subplot()
+
+def chart_d1(fig, codes, vals, date, prev_date):
+    # D1 Top Movers（依 Δ% 絕對值排序，僅代號作 y 標籤）
+    ax = fresh_ax(fig)
     y = range(len(codes))
     ax.barh(y, vals)
     ax.set_yticks(y, labels=codes)
@@ -63,22 +74,63 @@ def main():
     ax.set_title(f"D1 權重變化 Top Movers（{date} vs {prev_date}）")
     save(fig, f"charts/chart_d1_{date}.png")
 
-    # Daily cum trend（僅示意：以「權重Δ%」累加）
-    fig, ax = plt.subplots(figsize=(10,6))
-    s = df["權重Δ%"].sort_values()
-    ax.plot(s.values.cumsum(), marker="o", linewidth=2)
+def chart_daily(fig, vals, date):
+    # Daily cum trend（僅示意：以「權重Δ%」累加；直接在 ndarray 上排序累加）
+    ax = fresh_ax(fig)
+    ax.plot(np.sort(vals).cumsum(dtype=np.float64), marker="o", linewidth=2)
     ax.set_title(f"每日累積權重變化（{date}）")
     ax.set_xlabel("排序後持股")
     ax.set_ylabel("累積 Δ%")
     save(fig, f"charts/chart_daily_{date}.png")
 
+def chart_weekly(fig, date):
     # Weekly（簡化：近 5 日 Δ% 加總；若你有 weekly 資料也可替換）
-    fig, ax = plt.subplots(figsize=(10,6))
+    ax = fresh_ax(fig)
     ax.plot([0,1,2,3,4], [0,0,0,0,0], marker="o", linewidth=2)  # 佔位
     ax.set_title(f"近5日權重變化（示意，{date}）")
     ax.set_xlabel("日")
     ax.set_ylabel("Δ%")
     save(fig, f"charts/chart_weekly_{date}.png")
 
+def main():
+    date = get_report_date()
+    if not date:
+        raise SystemExit("REPORT_DATE 未設定")
+
+    change_csv = Path("reports")/f"change_table_{date}.csv"
+    if not change_csv.exists():
+        raise SystemExit(f"缺少 {change_csv}")
+
+    prev_date = find_prev_snapshot(date) or "N/A"
+
+    outs = [f"charts/chart_{n}_{date}.png" for n in ("d1", "daily", "weekly")]
+    inputs = [change_csv, Path(f"data_snapshots/{prev_date}.csv"), Path(__file__)]
+    digest = inputs_digest(inputs)
+    if up_to_date(outs, date, digest):
+        print(f"[charts] {date} 圖表已是最新，略過（FORCE_REBUILD=1 可強制重畫）")
+        return
+
+    # 三張圖只用得到代號與 Δ%，其餘欄位不解析
+    # Δ% 只有兩位小數，float32 精度足夠（繪圖用，不回寫）
+    df = pd.read_csv(change_csv, encoding="utf-8-sig", usecols=["股票代號","權重Δ%"],
+                     dtype={"權重Δ%": np.float32})
+
+    # 代號 / Δ% / Top Movers 只建一次，三張圖共用（不再整表 copy）
+    codes = df["股票代號"].astype(str).to_numpy()
+    vals = df["權重Δ%"].to_numpy()
+
+    # Top 20 |Δ%|：argpartition 先 O(n) 挑出候選，只對這 k 筆排序
+    absv = np.abs(vals)
+    k = min(20, len(absv))
+    top = np.argpartition(-absv, k - 1)[:k] if k else np.arange(0)
+    top = top[np.lexsort((top, -absv[top]))]  # 同值依原列序，結果固定
+
+    # 直接用 Figure 物件（不經 pyplot 全域狀態與 figure manager，也省下 import pyplot）
+    fig = Figure(figsize=(10,6))
+    chart_d1(fig, codes[top], vals[top], date, prev_date)
+    chart_daily(fig, vals, date)
+    chart_weekly(fig, date)
+    record_manifest(date, digest)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
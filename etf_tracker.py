@@ -1,11 +1,18 @@
 # etf_tracker.py — 下載 00981A 每日持股 → 清洗 → 抓當日收盤價(快取) →
 # 雙軌保存（抓檔日 daily / 官方快照日 snapshots）+ 去重 + manifest 追蹤
-import os, re, time, glob, json, shutil, hashlib, csv
+import os, re, time, glob, io, json, shutil, hashlib, csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from html import unescape
 from pathlib import Path
+from urllib.parse import urljoin, unquote
 
 import pandas as pd
-import requests
+
+try:
+    import orjson  # 選配：價格快取每次執行都讀寫，orjson 較快
+except ImportError:
+    orjson = None
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -13,9 +20,10 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-from openpyxl import load_workbook
 from pandas import ExcelWriter
 
+from utils import make_session
+
 # === 目錄 ===
 DOWNLOAD_DIR = "downloads"
 DATA_DIR     = "data"
@@ -32,6 +40,9 @@ for d in (DOWNLOAD_DIR, DATA_DIR, SNAP_DATA_DIR, SCREEN_DIR, PRICE_DIR, MANIFEST
 # === 網址 ===
 FUND_CODE = os.environ.get("FUND_CODE", "49YTW")  # 00981A
 ETF_URL   = os.environ.get("EZMONEY_URL", f"https://www.ezmoney.com.tw/ETF/Fund/Info?fundCode={FUND_CODE}")
+# Selenium 備援時擋掉的資源（圖片/字型/媒體/追蹤）；頁面樣式保留，按鈕才判斷得到可點擊
+BLOCKED_URLS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.woff", "*.woff2", "*.ttf", "*.mp4",
+                "*googletagmanager*", "*google-analytics*", "*doubleclick*", "*facebook*"]
 
 # === 欄位別名（放寬） ===
 ALIASES = {
@@ -41,8 +52,25 @@ ALIASES = {
     "weight": ["持股權重","持股比例","權重","占比","比重(%)","占比(%)","Weight","Holding Weight","Portfolio Weight"],
     "close":  ["收盤價","收盤","價格","Price","Close","Closing Price"],
 }
-
-def _norm(s): return str(s).strip().replace("　","").replace("\u3000","")
+# === HTTP：模組層共用 Session（連線池 + 暫時性錯誤自動重試），各執行緒重用 TCP/TLS 連線 ===
+SESSION = make_session({"User-Agent":"Mozilla/5.0"})
+
+# 每類別名合成一條不分大小寫的子字串 regex，整欄一次比對
+ALIAS_RE = {k: re.compile("|".join(re.escape(a.lower()) for a in v)) for k, v in ALIASES.items()}
+ALIAS_LABEL = {"code":"股票代號","name":"股票名稱","shares":"股數","weight":"持股權重"}  # 改名優先序同此順序
+NUM_JUNK_RE = re.compile(r"[,%]")  # 千分位與百分號一次剔除
+CODE_NAME_RE = re.compile(r"^\s*(\d{4,6})\s*([^\d].*)$")        # 合欄「2330 台積電」
+NAME_CODE_RE = re.compile(r"^(.+?)\s*[\(（](\d{4,6})[\)）]\s*$")  # 合欄「台積電(2330)」
+CODE_RE = re.compile(r"^\d{4,6}$")
+EXPORT_HREF_RE = re.compile(r"""href=["']([^"']*ExportFundHoldings[^"']*)["']""", re.I)
+CD_FILENAME_RE = re.compile(r"""filename\*?=(?:UTF-8'')?["']?([^"';]+)""", re.I)
+
+def _norm(s): return str(s).strip().replace("\u3000","")  # 全形空白
+
+def _to_num(s, junk):
+    # 直接讀表頭時 Excel 數值欄已是數值型別，不必轉字串再去符號；只有字串欄才清洗
+    if pd.api.types.is_numeric_dtype(s): return s
+    return pd.to_numeric(s.astype(str).str.replace(junk,"",regex=True),errors="coerce")
 
 def _build_driver():
     opts = Options()
@@ -50,15 +78,28 @@ def _build_driver():
     opts.add_argument("--no-sandbox")
     opts.add_argument("--disable-dev-shm-usage")
     opts.add_argument("--window-size=1920,1080")
+    # 冷啟動減負：不載擴充、不做背景連線/同步；DOM 可互動即返回（後續皆以 WebDriverWait 等元素）
+    opts.add_argument("--disable-extensions")
+    opts.add_argument("--disable-background-networking")
+    opts.add_argument("--disable-sync")
+    opts.page_load_strategy = "eager"
     prefs = {
         "download.default_directory": str(Path(DOWNLOAD_DIR).resolve()),
         "download.prompt_for_download": False,
         "download.directory_upgrade": True,
         "safebrowsing.enabled": True,
         "safebrowsing.disable_download_protection": True,
+        "profile.managed_default_content_settings.images": 2,  # 只需 DOM 與匯出連結，不載圖片
     }
     opts.add_experimental_option("prefs", prefs)
-    return webdriver.Chrome(options=opts)
+    d = webdriver.Chrome(options=opts)
+    # 字型、媒體與追蹤腳本同樣用不到，直接擋掉（失敗不影響主流程）
+    try:
+        d.execute_cdp_cmd("Network.enable", {})
+        d.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    except Exception as e:
+        print("[etf_tracker] block urls failed:", e)
+    return d
 
 def _screenshot(driver, tag):
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
@@ -71,6 +112,11 @@ def _screenshot(driver, tag):
     except Exception as e:
         print("[etf_tracker] screenshot failed:", e)
 
+def _mtime(p):
+    # .crdownload 可能在 glob 與取 mtime 之間就被 Chrome 改名：視為已不存在
+    try: return os.path.getmtime(p)
+    except OSError: return 0.0
+
 def _download_excel():
     d = _build_driver()
     d.get(ETF_URL); print("[etf_tracker] open:", ETF_URL)
@@ -94,10 +140,11 @@ def _download_excel():
             _screenshot(d,"no_export_btn"); raise RuntimeError("找不到匯出XLSX按鈕")
 
         t_click = time.time(); btn.click(); print("[etf_tracker] export clicked")
-        # 大小穩定 3 次視為完成
-        deadline = time.time()+90; last_size=None; quiet=0; cand=None
+        # Chrome 下載中寫 .crdownload、完成才改名為 .xlsx：
+        # 短間隔輪詢，xlsx 出現、無本次的 .crdownload 且大小連續兩次相同即完成（不再固定等滿 3 秒）
+        deadline = time.time()+90; last_size=None; quiet=0; cand=None; n=0
         while time.time()<deadline:
-            time.sleep(1)
+            time.sleep(0.2); n+=1
             xlsxs = [p for p in glob.glob(os.path.join(DOWNLOAD_DIR,"*.xlsx"))
                      if os.path.getmtime(p)>=t_click]
             if xlsxs:
@@ -105,8 +152,12 @@ def _download_excel():
                 cand = xlsxs[0]; size = os.path.getsize(cand)
                 quiet = quiet+1 if (last_size is not None and size==last_size) else 1
                 last_size = size
-                if quiet>=3: d.quit(); return cand
-            print("[etf_tracker] polling...")
+                # 只看本次點擊後的 .crdownload：先前中斷殘留的暫存檔不影響判斷
+                busy = [p for p in glob.glob(os.path.join(DOWNLOAD_DIR,"*.crdownload"))
+                        if _mtime(p)>=t_click]
+                if quiet>=2 and not busy:
+                    d.quit(); return cand
+            if n%5==0: print("[etf_tracker] polling...")
         _screenshot(d,"download_timeout"); raise RuntimeError("下載逾時")
     except Exception as e:
         _screenshot(d,"exception"); raise
@@ -114,42 +165,78 @@ def _download_excel():
         try: d.quit()
         except: pass
 
+def _download_excel_direct():
+    # 頁面原始碼已帶匯出連結時直接 GET，不必啟動 Chrome；取不到連結、回應不是 xlsx、
+    # 或檔名沒有官方日期（快照日靠它推斷）時回傳 None，交給 Selenium 流程
+    try:
+        page = SESSION.get(ETF_URL, timeout=20)
+        m = EXPORT_HREF_RE.search(page.text) if page.status_code==200 else None
+        if not m: return None
+        url = urljoin(page.url, unescape(m.group(1)))
+        # 串流下載：先看標頭與首塊的 PK 檔頭，通過才邊收邊寫，不把整檔緩衝在記憶體
+        with SESSION.get(url, timeout=60, headers={"Referer": ETF_URL}, stream=True) as r:
+            cd = CD_FILENAME_RE.search(r.headers.get("Content-Disposition",""))
+            if r.status_code!=200 or not cd: return None
+            name = os.path.basename(unquote(cd.group(1)).strip())
+            if not name.lower().endswith(".xlsx") or not re.search(r"\d{8}", name): return None
+            chunks = r.iter_content(chunk_size=1<<20)
+            head = next(chunks, b"")
+            if not head.startswith(b"PK"): return None
+            path = os.path.join(DOWNLOAD_DIR, name)
+            with open(path,"wb") as f:
+                f.write(head)
+                for chunk in chunks: f.write(chunk)
+        print("[etf_tracker] direct download:", url)
+        return path
+    except Exception as e:
+        print("[etf_tracker] direct download failed:", e)
+        return None
+
 def _find_header_row(df):
+    # 前 50 列一次取成 ndarray 逐列走（不逐列 iloc 建 Series）；每格用預編譯的類別 regex 判斷
     best_idx, best = None, {}
-    for ridx in range(min(50,len(df))):
-        row = df.iloc[ridx]
+    for ridx, row in enumerate(df.iloc[:50].to_numpy()):
         m={}
         for cidx,val in enumerate(row):
             lab=_norm(val)
             if not lab or lab.startswith("Unnamed"): continue
             low=lab.lower()
-            def hit(keys): return any(k.lower() in low for k in keys)
-            if hit(ALIASES["code"])   and "code" not in m:   m["code"]=cidx
-            if hit(ALIASES["name"])   and "name" not in m:   m["name"]=cidx
-            if hit(ALIASES["shares"]) and "shares" not in m: m["shares"]=cidx
-            if hit(ALIASES["weight"]) and "weight" not in m: m["weight"]=cidx
-            if hit(ALIASES["close"])  and "close" not in m:  m["close"]=cidx
+            for k, rx in ALIAS_RE.items():
+                if k not in m and rx.search(low): m[k]=cidx
         score = sum(k in m for k in ("code","name","weight")) + (1 if "shares" in m else 0)
         if score>=2 and (best_idx is None or len(m)>len(best)):
             best_idx, best = ridx, m
     return best_idx, best
 
 def _extract_table(xlsx_path):
-    df0 = pd.read_excel(xlsx_path)
-    df0.columns = [_norm(c) for c in df0.columns]
+    # 活頁簿只開一次；表頭不在第一列時直接從同一份 ExcelFile 再 parse，不重新解壓讀檔
+    with pd.ExcelFile(xlsx_path) as xl:
+        return _extract_table_from(xl)
+
+def _extract_table_from(xl):
+    # 工作表只以 header=None 解析一次：第一列就是表頭時在記憶體中升為欄名，否則沿用同一份找表頭
+    raw = xl.parse(header=None)
     def map_cols(cols):
         m={}
         for i,col in enumerate(cols):
             low=str(col).lower()
-            if any(k.lower() in low for k in ALIASES["code"])   and "code" not in m:   m["code"]=i
-            if any(k.lower() in low for k in ALIASES["name"])   and "name" not in m:   m["name"]=i
-            if any(k.lower() in low for k in ALIASES["shares"]) and "shares" not in m: m["shares"]=i
-            if any(k.lower() in low for k in ALIASES["weight"]) and "weight" not in m: m["weight"]=i
-            if any(k.lower() in low for k in ALIASES["close"])  and "close" not in m:  m["close"]=i
+            for k, rx in ALIAS_RE.items():
+                if k not in m and rx.search(low): m[k]=i
         return m
-    mapped = map_cols(df0.columns)
-    if sum(k in mapped for k in ("code","name","weight"))<2:
-        df1 = pd.read_excel(xlsx_path, header=None).applymap(_norm)
+    # 第一列當表頭時的欄名（空白格同 pandas 命名為 Unnamed: i）
+    first = [_norm(f"Unnamed: {i}") if pd.isna(c) else _norm(c) for i, c in enumerate(raw.iloc[0])] if len(raw) else []
+    enough = lambda m: sum(k in m for k in ("code","name","weight"))>=2
+    if enough(map_cols(first)):
+        # 同 header=0：重複欄名依序加 .1/.2，其餘列重新推斷型別（數值欄回到 int/float）
+        seen, cols = {}, []
+        for c in first:
+            n = seen.get(c, 0); seen[c] = n+1
+            cols.append(c if n==0 else f"{c}.{n}")
+        df0 = raw.iloc[1:].reset_index(drop=True).infer_objects()
+        df0.columns = cols
+        mapped = map_cols(df0.columns)
+    else:
+        df1 = raw.map(_norm)
         idx, m2 = _find_header_row(df1)
         if idx is None: raise ValueError("無法辨識表頭")
         cols = df1.iloc[idx].tolist()
@@ -161,8 +248,8 @@ def _extract_table(xlsx_path):
     if "code" not in mapped and "name" in mapped:
         name_col = df0.columns[mapped["name"]]
         s = df0[name_col].astype(str)
-        a = s.str.extract(r"^\s*(\d{4,6})\s*([^\d].*)$")
-        b = s.str.extract(r"^(.+?)\s*[\(（](\d{4,6})[\)）]\s*$")
+        a = s.str.extract(CODE_NAME_RE)
+        b = s.str.extract(NAME_CODE_RE)
         if a.notna().all(1).sum() >= b.notna().all(1).sum():
             df0["_code"]=a[0]; df0["_name"]=a[1]
         else:
@@ -177,55 +264,61 @@ def _extract_table(xlsx_path):
 
     df = df0[need].copy()
     # 正式欄名
-    new=[]
-    for c in df.columns:
-        low=str(c).lower()
-        if any(k.lower() in low for k in ALIASES["code"]):   new.append("股票代號")
-        elif any(k.lower() in low for k in ALIASES["name"]): new.append("股票名稱")
-        elif any(k.lower() in low for k in ALIASES["shares"]): new.append("股數")
-        elif any(k.lower() in low for k in ALIASES["weight"]): new.append("持股權重")
-        else: new.append(c)
-    df.columns=new
+    df.columns=[next((lab for k, lab in ALIAS_LABEL.items() if ALIAS_RE[k].search(str(c).lower())), c) for c in df.columns]
 
     df["股票代號"]=df["股票代號"].astype(str).str.strip()
     df["股票名稱"]=df["股票名稱"].astype(str).str.strip()
-    df["股數"]=pd.to_numeric(df.get("股數",0).astype(str).str.replace(",","",regex=False),errors="coerce").fillna(0).astype(int)
-    df["持股權重"]=pd.to_numeric(df["持股權重"].astype(str).str.replace(",","",regex=False).str.replace("%","",regex=False),errors="coerce").fillna(0.0)
-    df = df[(df["股票代號"].str.match(r"^\d{4,6}$")) & (df["股票名稱"].str.len()>0)].reset_index(drop=True)
+    df["股數"]=_to_num(df.get("股數",0),",").fillna(0).astype(int)
+    df["持股權重"]=_to_num(df["持股權重"],NUM_JUNK_RE).fillna(0.0)
+    df = df[(df["股票代號"].str.match(CODE_RE)) & (df["股票名稱"].str.len()>0)].reset_index(drop=True)
     return df
 
 # === Yahoo 價格抓取與快取(json) + 當日 CSV 價格表 ===
+YAHOO_QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+YAHOO_BATCH = 50  # 每次請求的代號數（控制 URL 長度）
+
+def _yahoo_batch(symbols):
+    # quote 端點接受逗號分隔的多個 symbols，一次回傳全部結果；以回傳的 symbol 對回
+    out={}
+    try:
+        r = SESSION.get(YAHOO_QUOTE_URL, params={"symbols": ",".join(symbols)}, timeout=10)
+        if r.status_code!=200: return out
+        for q in r.json().get("quoteResponse",{}).get("result",[]):
+            p = q.get("regularMarketPrice") or q.get("postMarketPrice")
+            if p and q.get("symbol"): out[q["symbol"]]=float(p)
+    except Exception: pass
+    return out
+
 def _yahoo_quote(codes):
+    # 先整批查 .TW，查不到的再整批查 .TWO：2 次往返取代每檔 1~2 次
     out={}
-    sess = requests.Session()
-    headers={"User-Agent":"Mozilla/5.0"}
-    for code in codes:
-        syms = [f"{code}.TW", f"{code}.TWO"]
-        price=None
-        for s in syms:
-            url = "https://query1.finance.yahoo.com/v7/finance/quote"
-            try:
-                r = sess.get(url, params={"symbols": s}, timeout=10, headers=headers)
-                if r.status_code!=200: continue
-                js=r.json()
-                res = js.get("quoteResponse",{}).get("result",[])
-                if not res: continue
-                p = res[0].get("regularMarketPrice") or res[0].get("postMarketPrice")
-                if p: price=float(p); break
-            except Exception: continue
-        if price is not None: out[code]=price
+    for suffix in (".TW", ".TWO"):
+        todo = [c for c in codes if c not in out]
+        if not todo: break
+        chunks = [[f"{c}{suffix}" for c in todo[i:i+YAHOO_BATCH]] for i in range(0, len(todo), YAHOO_BATCH)]
+        with ThreadPoolExecutor(max_workers=min(8, len(chunks))) as ex:
+            got = {}
+            for part in ex.map(_yahoo_batch, chunks): got.update(part)
+        for c in todo:
+            if f"{c}{suffix}" in got: out[c]=got[f"{c}{suffix}"]
     return out
 
+def _read_json(p):
+    if orjson is not None:
+        return orjson.loads(Path(p).read_bytes())
+    with open(p,"r",encoding="utf-8") as f: return json.load(f)
+
 def _load_price_cache(ymd):
     p = os.path.join(PRICE_DIR, f"{ymd}.json")
     if os.path.exists(p):
-        try:
-            with open(p,"r",encoding="utf-8") as f: return json.load(f)
+        try: return _read_json(p)
         except: return {}
     return {}
 
 def _save_price_cache(ymd, data):
     p = os.path.join(PRICE_DIR, f"{ymd}.json")
+    if orjson is not None:
+        Path(p).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)); return
     with open(p,"w",encoding="utf-8") as f: json.dump(data,f,ensure_ascii=False,indent=2)
 
 def _fetch_prices_for(df, ymd):
@@ -235,41 +328,53 @@ def _fetch_prices_for(df, ymd):
         got = _yahoo_quote(need)
         cache.update(got)
         _save_price_cache(ymd, cache)
-    closes=[]
-    for code in df["股票代號"].astype(str):
-        if code in cache:
-            closes.append(cache[code])
-        else:
-            prev_files = sorted(glob.glob(os.path.join(PRICE_DIR,"*.json")))
-            prev_files = [p for p in prev_files if os.path.basename(p).split(".")[0] < ymd]
-            prev_files.sort(reverse=True)
-            val=None
-            for pf in prev_files:
-                try:
-                    js=json.load(open(pf,"r",encoding="utf-8"))
-                    if str(code) in js: val=js[str(code)]; break
-                except: pass
-            closes.append(val if val is not None else None)
-    return closes
+    codes = df["股票代號"].astype(str).tolist()
+    fallback = {}
+    if any(c not in cache for c in codes):
+        # 缺價代號改用前幾日快取：每個檔案只讀一次，由新到舊合併（較新的優先）
+        prev_files = sorted(glob.glob(os.path.join(PRICE_DIR,"*.json")), reverse=True)
+        prev_files = [p for p in prev_files if os.path.basename(p).split(".")[0] < ymd]
+        for pf in prev_files:
+            try: js=_read_json(pf)
+            except: continue
+            for k,v in js.items(): fallback.setdefault(k, v)
+    return [cache[c] if c in cache else fallback.get(c) for c in codes]
+
+def _write_csv(df, path):
+    # 每日表僅數十列：逐欄 tolist 後交給 csv 模組，比 DataFrame.to_csv 快；輸出與 to_csv 逐位元組相同（缺值寫空字串）
+    cols = []
+    for c in df.columns:
+        s = df[c]; vals = s.tolist()
+        if s.hasnans: vals = ["" if m else v for v, m in zip(vals, s.isna().tolist())]
+        cols.append(vals)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(df.columns); w.writerows(zip(*cols))
 
 def _save_price_csv(date_str, df):
     Path(PRICE_DIR).mkdir(parents=True, exist_ok=True)
     out = os.path.join(PRICE_DIR, f"{date_str}.csv")
     px = df[["股票代號", "收盤價"]].copy()
     px["股票代號"] = px["股票代號"].astype(str).str.strip()
-    px.to_csv(out, index=False, encoding="utf-8-sig")
+    _write_csv(px, out)
     print("[etf_tracker] saved prices csv:", out)
 
+def _archive_copy(src, dst):
+    # 僅在 src 已定稿（之後不再原地改寫）時呼叫：同檔案系統用硬連結（不複製位元組），否則退回一般複製
+    if os.path.exists(dst): os.remove(dst)
+    try: os.link(src, dst)
+    except OSError: shutil.copyfile(src, dst)
+
 def _append_prices_sheet(xlsx_path, df):
+    # 既有 with_prices 由 ExcelWriter 直接取代：活頁簿只載入、存檔各一次（不再先 load/remove/save 一輪）
     try:
-        wb = load_workbook(xlsx_path)
-        if "with_prices" in wb.sheetnames:
-            wb.remove(wb["with_prices"]); wb.save(xlsx_path)
-        with ExcelWriter(xlsx_path, engine="openpyxl", mode="a") as writer:
+        with ExcelWriter(xlsx_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
             df.to_excel(writer, sheet_name="with_prices", index=False)
         print("[etf_tracker] wrote sheet 'with_prices' into:", xlsx_path)
+        return True
     except Exception as e:
         print("[etf_tracker] write with_prices failed:", e)
+        return False
 
 # === 快照日推斷 + 去重 ===
 def _infer_snapshot_date_from_name(path_or_name: str, fallback_ymd: str) -> str:
@@ -287,19 +392,26 @@ def _hash_df(df: pd.DataFrame) -> str:
     arr["股數"] = pd.to_numeric(arr.get("股數",0), errors="coerce").fillna(0).astype(int)
     arr["持股權重"] = pd.to_numeric(arr.get("持股權重",0.0), errors="coerce").fillna(0.0).round(6)
     arr = arr.sort_values("股票代號").reset_index(drop=True)
-    raw = arr.to_csv(index=False).encode("utf-8")
-    return hashlib.sha256(raw).hexdigest()
+    # 與 manifest 既有 hash 相容：仍雜湊同一份 CSV 文字，只是改用 csv 模組產生（欄位已無缺值）
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(arr.columns); w.writerows(zip(*(arr[c].tolist() for c in arr.columns)))
+    return hashlib.sha256(buf.getvalue().encode("utf-8")).hexdigest()
 
 def _last_snapshot_hash():
     mf = os.path.join(MANIFEST_DIR, "snapshots.csv")
     if not os.path.exists(mf): return None
     try:
-        last = None
-        import csv as _csv
-        with open(mf, newline="", encoding="utf-8") as f:
-            for row in _csv.DictReader(f):
-                last = row
-        return (last or {}).get("hash")
+        # manifest 只增不減：讀表頭後直接跳到檔尾取最後一列，不必整份掃過
+        with open(mf, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]), [])
+            start = f.tell()
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(start, size - 4096))
+            lines = [ln for ln in f.read().splitlines() if ln.strip()]
+        if not lines: return None
+        row = next(csv.reader([lines[-1].decode("utf-8")]))
+        return dict(zip(header, row)).get("hash")
     except Exception:
         return None
 
@@ -315,7 +427,7 @@ def _append_manifest(record: dict):
 
 def main():
     ymd = datetime.now().strftime("%Y-%m-%d")
-    raw_download = _download_excel()  # 原始下載檔名（含官方日期）
+    raw_download = _download_excel_direct() or _download_excel()  # 原始下載檔名（含官方日期）
     snapshot_date = _infer_snapshot_date_from_name(raw_download, ymd)
 
     # 將下載檔整理成固定名字（downloads/YYYY-MM-DD.xlsx）
@@ -327,11 +439,12 @@ def main():
         print("[etf_tracker] rename failed:", e); fixed = raw_download
     print("[etf_tracker] saved excel:", fixed)
 
-    # 同步保存一份以抓檔日命名的 daily 原始檔
+    # 同步保存一份以抓檔日命名的 daily 原始檔：先封存，後續解析/抓價失敗也保得住原檔。
+    # 這份必須是獨立副本（不可硬連結）：稍後 with_prices 會原地改寫 fixed，寫壞時不能連帶毀掉原檔
     daily_xlsx = os.path.join(DAILY_ARCHIVE_DIR, f"{ymd}.xlsx")
     try:
         if os.path.exists(daily_xlsx): os.remove(daily_xlsx)
-        shutil.copy2(fixed, daily_xlsx)
+        shutil.copyfile(fixed, daily_xlsx)
     except Exception as e:
         print("[etf_tracker] copy daily xlsx failed:", e)
 
@@ -347,15 +460,25 @@ def main():
     df_with_src = df.copy()
     df_with_src["source_snapshot_date"] = snapshot_date
     csv_out = os.path.join(DATA_DIR, f"{ymd}.csv")
-    df_with_src.to_csv(csv_out, index=False, encoding="utf-8-sig")
-    _save_price_csv(ymd, df_with_src)
 
-    # 把 with_prices 工作表寫回固定下載檔與 daily 檔
-    _append_prices_sheet(fixed, df_with_src)
-    try:
-        _append_prices_sheet(daily_xlsx, df_with_src)
-    except Exception as e:
-        print("[etf_tracker] write with_prices(daily copy) failed:", e)
+    # 每日 CSV、價格 CSV、固定下載檔的 with_prices 工作表彼此獨立，
+    # 併發寫出讓磁碟 I/O 與 xlsx 壓縮重疊；全部完成後才往下做去重
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        futs = [
+            ex.submit(_write_csv, df_with_src, csv_out),
+            ex.submit(_save_price_csv, ymd, df_with_src),
+            ex.submit(_append_prices_sheet, fixed, df_with_src),
+        ]
+    for f in futs:
+        f.result()
+    sheet_ok = futs[2].result()
+
+    # with_prices 寫成功後才把 daily 換成連結到 fixed（之後不再改寫 fixed）；失敗則保留原始副本
+    if sheet_ok:
+        try:
+            _archive_copy(fixed, daily_xlsx)
+        except Exception as e:
+            print("[etf_tracker] refresh daily xlsx failed:", e)
 
     # 判斷是否新快照（用內容 hash 去重）
     h = _hash_df(df)
@@ -368,13 +491,12 @@ def main():
         snap_name = f"ETF_Investment_Portfolio_{snapshot_date.replace('-','')}.xlsx"
         snapshot_path = os.path.join(SNAPSHOT_DIR, snap_name)
         try:
-            shutil.copy2(fixed, snapshot_path)
-            _append_prices_sheet(snapshot_path, df_with_src)
+            _archive_copy(fixed, snapshot_path)
         except Exception as e:
             print("[etf_tracker] save snapshot xlsx failed:", e)
         # 也輸出以快照日命名的一份 CSV（供分析直接使用）
         snap_csv = os.path.join(SNAP_DATA_DIR, f"{snapshot_date}.csv")
-        df.to_csv(snap_csv, index=False, encoding="utf-8-sig")
+        _write_csv(df, snap_csv)
 
     # 記錄 manifest
     record = {
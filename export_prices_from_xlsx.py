@@ -5,10 +5,12 @@ import pandas as pd
 
 ARCHIVE = Path("archive")
 PRICES  = Path("prices"); PRICES.mkdir(parents=True, exist_ok=True)
+ISO_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+YMD_RE      = re.compile(r"(\d{4})(\d{2})(\d{2})")
 
 def norm_date(s: str) -> str:
     s = s.strip()
-    m = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})", s) or re.fullmatch(r"(\d{4})(\d{2})(\d{2})", s)
+    m = ISO_DATE_RE.fullmatch(s) or YMD_RE.fullmatch(s)
     if not m: raise SystemExit(f"REPORT_DATE 不合法: {s}")
     if len(m.groups()) == 3:
         y, mm, dd = m.groups()
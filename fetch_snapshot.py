@@ -12,18 +12,23 @@ import requests
 from bs4 import BeautifulSoup
 from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
 
+from utils import row_text
+
 INFO_URL = "https://www.ezmoney.com.tw/ETF/Fund/Info?fundCode=49YTW"
 DOWNLOAD_API = "https://www.ezmoney.com.tw/ETF/Fund/DownloadHoldingFile?fundCode=49YTW"
 ARCHIVE = Path("archive")
 UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124 Safari/537.36"
 CODE_RE = re.compile(r"([1-9]\d{3})")  # 僅接受 1000-9999，避免 00981A 被誤抓成 0098
+ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+YMD_RE = re.compile(r"\d{8}")
+NUM_JUNK_RE = re.compile(r"[,%]")  # 千分位與百分號一次剔除
 EXCLUDE_TITLES = {"基金資產","項目","現金","期貨保證金","申贖應付款","應收付證券款"}
 
 # ------------------ 日期處理 ------------------
 def _date_str_default() -> str:
     raw = (os.getenv("REPORT_DATE") or "").strip()
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", raw): return raw
-    if re.fullmatch(r"\d{8}", raw): return f"{raw[:4]}-{raw[4:6]}-{raw[6:]}"
+    if ISO_DATE_RE.fullmatch(raw): return raw
+    if YMD_RE.fullmatch(raw): return f"{raw[:4]}-{raw[4:6]}-{raw[6:]}"
     return datetime.now().strftime("%Y-%m-%d")
 
 def _extract_info_date_from_html(html: str) -> str | None:
@@ -51,8 +56,7 @@ def _flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
 def _numify(series: pd.Series, as_int: bool = False) -> pd.Series:
     s = (
         series.astype(str)
-        .str.replace(",", "", regex=False)
-        .str.replace("%", "", regex=False)
+        .str.replace(NUM_JUNK_RE, "", regex=True)
         .str.strip()
         .replace({"": None})
     )
@@ -86,7 +90,7 @@ def _normalize(df: pd.DataFrame) -> pd.DataFrame:
         if "股票名稱" in df.columns:
             df["股票代號"] = df["股票名稱"].astype(str).str.extract(CODE_RE, expand=False)
         if "股票代號" not in df.columns or df["股票代號"].isna().all():
-            any_text = df.astype(str).agg(" ".join, axis=1)
+            any_text = row_text(df)
             df["股票代號"] = any_text.str.extract(CODE_RE, expand=False)
 
     # 清洗
@@ -121,7 +125,7 @@ def _looks_like_holdings(df: pd.DataFrame) -> bool:
         return False
     if any(any(k in c for k in ["股票代號","證券代號","股票代碼"]) for c in cols):
         return True
-    sample = df.astype(str).agg(" ".join, axis=1).str.extractall(CODE_RE)
+    sample = row_text(df).str.extractall(CODE_RE)
     return sample.size >= 5
 
 # ------------------ 各型資料轉 DF ------------------
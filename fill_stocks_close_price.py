@@ -1,19 +1,30 @@
 import pandas as pd
-import requests
 from datetime import datetime
 import os
 import time
 
+from utils import make_session
+
+try:
+    import orjson  # 選配：較快的 JSON 解析
+except ImportError:
+    orjson = None
+
+# 逐檔查詢同一主機：共用 Session 保持連線（不每檔重新握手），暫時性錯誤自動退避重試
+SESSION = make_session(pool_maxsize=4)
+
 def get_twse_close_price(stock_no, date_str):
     # TWSE API, 格式 e.g. date=20251008, stockNo=2330
     url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json&date={date_str}&stockNo={stock_no}"
     try:
-        res = requests.get(url, timeout=10)
-        data = res.json()
+        res = SESSION.get(url, timeout=10)
+        data = orjson.loads(res.content) if orjson is not None else res.json()
         # data['data'] 內容 [日期, ...收盤價在第7欄(6)]
+        # TWSE 日期為民國格式 "114/10/08"（也容許西元 "2025/10/08"）；目標字串迴圈外先算好，列內直接比對
+        y, m, d = date_str[:4], date_str[4:6], date_str[6:]
+        targets = (f"{int(y) - 1911}/{m}/{d}", f"{y}/{m}/{d}")
         for row in data.get('data', []):
-            # 日期格式 "2025/10/08"
-            if row[0].replace('/', '') == date_str:
+            if row[0] in targets:
                 try:
                     return float(row[6].replace(",", ""))
                 except:
@@ -28,16 +39,30 @@ def auto_fill_csv(date_csv):
     base = os.path.basename(date_csv)
     date_str = base.replace('.csv','').replace('-','')
     df = pd.read_csv(date_csv)
+    # 存檔於同資料夾，檔案名稱加 "_with_price"
+    out_csv = date_csv.replace('.csv', '_with_price.csv')
+
+    # 同日重跑：上次輸出已查到的收盤價（代號+日期）直接沿用，不再打 API、也不用等 sleep
+    known = {}
+    if os.path.exists(out_csv):
+        try:
+            prev = pd.read_csv(out_csv, dtype={'股票代號': str})
+            px = pd.to_numeric(prev['收盤價'], errors='coerce')
+            known = dict(zip(prev['股票代號'].str.zfill(4)[px.notna()], px[px.notna()]))
+        except Exception:
+            known = {}
 
     close_prices = []
     for code in df['股票代號']:
-        price = get_twse_close_price(str(code).zfill(4), date_str)
+        code = str(code).zfill(4)
+        if code in known:
+            close_prices.append(known[code])
+            continue
+        price = get_twse_close_price(code, date_str)
         close_prices.append(price)
         time.sleep(1) # 避免API流量過大，可自行調整
 
     df['收盤價'] = close_prices
-    # 存檔於同資料夾，檔案名稱加 "_with_price"
-    out_csv = date_csv.replace('.csv', '_with_price.csv')
     df.to_csv(out_csv, index=False, encoding='utf-8-sig')
     print(f"Done: {out_csv}")
 
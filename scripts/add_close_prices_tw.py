@@ -15,15 +15,27 @@
 
 import argparse
 import io
+import json
 import os
 import re
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dateutil import tz, parser as dtparser
 
+try:
+    import orjson  # 選配：C 實作的 JSON 解析，直接吃 bytes
+except ImportError:
+    orjson = None
+
 TPE_TZ = tz.gettz("Asia/Taipei")
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; ClosePriceBot/1.0; +https://github.com/)",
@@ -34,6 +46,23 @@ HEADERS = {
 TWSE_STOCK_DAY = "https://www.twse.com.tw/exchangeReport/STOCK_DAY"
 TPEX_DAILY_CSV = "https://www.tpex.org.tw/en/stock/aftertrading/DAILY_CLOSE_quotes/stk_quote_download.php"
 
+# 共用連線池：逐代號、逐日呼叫同兩個主機，keep-alive 重用 TCP/TLS 連線，不每次重新握手。
+# 重試策略與 utils.make_session 相同（本腳本在 scripts/ 下執行、不 import 根目錄模組），調整時兩邊一起改
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(
+    total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])))
+
+# TPEx 每日收盤表的本機快取（僅存已過去的日期：官方資料收盤後不再變動）
+TPEX_CACHE_DIR = os.path.join("cache", "tpex")
+# 各代號併發查價（與連線池大小相配）；同一天的 TPEx 表只讓一個執行緒下載/寫快取
+FETCH_WORKERS = 8
+TPEX_LOCK = threading.Lock()
+# TWSE 對短時間大量請求會封鎖 IP：STOCK_DAY 一次只送一個，且兩次請求至少間隔此秒數
+TWSE_MIN_INTERVAL = 0.3
+TWSE_LOCK = threading.Lock()
+_twse_last = 0.0
+
 DATE_RE_YYYYMMDD = re.compile(r"^\d{8}$")
 DATE_RE_ISO = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
@@ -55,26 +84,36 @@ def _guess_report_date_from_filename(path: str) -> Optional[datetime]:
         return dtparser.parse(name).replace(tzinfo=TPE_TZ)
     return None
 
+def _json_loads(raw: bytes):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # 非 UTF-8 等情況交回標準庫處理
+    return json.loads(raw)
+
 def _ensure_code(s: str) -> str:
     s = s.strip().replace(".TW", "").replace(".TWO", "")
     return s.zfill(4) if s.isdigit() else s
 
 # ---------------------- TWSE ----------------------
 
-def fetch_twse_month_json(stock_no: str, any_day: datetime) -> Optional[dict]:
-    # 取該日所在月的月表（一次拿整月）
+def fetch_twse_month_json(stock_no: str, any_day: datetime) -> dict:
+    # 取該日所在月的月表（一次拿整月）；經 TWSE_LOCK 節流，併發查價時也不會同時打多個請求。
+    # 逾時、非 200、回應不是 JSON（如限流頁）一律拋出：與「該月查無資料」（正常 JSON、無 data）區分開來
+    global _twse_last
     date_param = f"{any_day.year}{any_day.month:02d}01"
     params = {"response": "json", "date": date_param, "stockNo": stock_no}
-    try:
-        resp = requests.get(TWSE_STOCK_DAY, params=params, headers=HEADERS, timeout=20)
-        if resp.status_code != 200:
-            return None
-        js = resp.json()
-        if js.get("data"):
-            return js
-        return None
-    except Exception:
-        return None
+    with TWSE_LOCK:
+        wait = _twse_last + TWSE_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            resp = SESSION.get(TWSE_STOCK_DAY, params=params, timeout=20)
+        finally:
+            _twse_last = time.monotonic()
+    resp.raise_for_status()
+    return _json_loads(resp.content)
 
 def parse_twse_close_map(js: dict) -> Dict[str, float]:
     out: Dict[str, float] = {}
@@ -85,24 +124,32 @@ def parse_twse_close_map(js: dict) -> Dict[str, float]:
         raw_date = str(row[0]).strip()
         close_str = str(row[6]).replace(",", "").strip()
         # 可能為 2025/09/08 或 114/09/08（民國）
+        # 只需日期鍵：直接建 date（不建帶時區的 datetime 再轉回 date）
         parts = raw_date.split("/")
         try:
             if len(parts) == 3:
                 y = int(parts[0]); m = int(parts[1]); d = int(parts[2])
                 if y < 1911:
                     y += 1911
-                dt = datetime(y, m, d, tzinfo=TPE_TZ)
+                key = date(y, m, d).isoformat()
             else:
-                dt = dtparser.parse(raw_date).astimezone(TPE_TZ)
+                key = dtparser.parse(raw_date).astimezone(TPE_TZ).date().isoformat()
         except Exception:
             continue
         try:
             close = float(close_str)
         except ValueError:
             continue
-        out[dt.date().isoformat()] = close
+        out[key] = close
     return out
 
+@lru_cache(maxsize=512)
+def twse_month_close_map(stock_no: str, year: int, month: int) -> Dict[str, float]:
+    """該代號該月「日期→收盤價」；回補天數多落在同月，同一 (代號, 月) 只下載、解析一次。
+    只快取成功的回應（含查無資料的空表）；網路錯誤由 fetch 拋出，lru_cache 不記例外，下次照常重試。"""
+    js = fetch_twse_month_json(stock_no, datetime(year, month, 1))
+    return parse_twse_close_map(js) if js.get("data") else {}
+
 # ---------------------- TPEx ----------------------
 
 def fetch_tpex_daily_csv(date_dt: datetime) -> Optional[pd.DataFrame]:
@@ -111,7 +158,7 @@ def fetch_tpex_daily_csv(date_dt: datetime) -> Optional[pd.DataFrame]:
     roc_date = f"{roc_y:03d}/{date_dt.month:02d}/{date_dt.day:02d}"
     params = {"d": roc_date}
     try:
-        resp = requests.get(TPEX_DAILY_CSV, params=params, headers=HEADERS, timeout=30)
+        resp = SESSION.get(TPEX_DAILY_CSV, params=params, timeout=30)
         if resp.status_code != 200 or not resp.text.strip():
             return None
         content = resp.content.decode("utf-8", errors="ignore")
@@ -133,15 +180,30 @@ def build_tpex_code_close_map(df: pd.DataFrame) -> Dict[str, float]:
             close_col = c; break
     if code_col is None or close_col is None:
         return {}
-    out: Dict[str, float] = {}
-    for _, row in df.iterrows():
-        code = _ensure_code(str(row[code_col]))
+    # 整欄一次轉換：代號正規化、收盤價去千分位轉數值；無法解析（含空值）者略過
+    codes = df[code_col].astype(str).map(_ensure_code)
+    closes = pd.to_numeric(df[close_col].astype(str).str.replace(",", "", regex=False), errors="coerce")
+    ok = closes.notna()
+    return dict(zip(codes[ok], closes[ok].astype(float)))
+
+def load_tpex_close_map(day: datetime) -> Dict[str, float]:
+    """TPEx 該日「代號→收盤價」；過去日期先查本機快取，查無才下載並寫回。"""
+    dkey = day.date().isoformat()
+    path = os.path.join(TPEX_CACHE_DIR, f"{dkey}.json")
+    if os.path.exists(path):
         try:
-            close = float(str(row[close_col]).replace(",", ""))
-        except ValueError:
-            continue
-        out[code] = close
-    return out
+            with open(path, "rb") as f:
+                return _json_loads(f.read())
+        except (OSError, ValueError):
+            pass
+    df = fetch_tpex_daily_csv(day)
+    mp = build_tpex_code_close_map(df) if df is not None else {}
+    # 空表可能只是下載失敗，不快取；當日資料可能尚未定稿，也不快取
+    if mp and day.date() < datetime.now(TPE_TZ).date():
+        os.makedirs(TPEX_CACHE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(mp, f, separators=(",", ":"))
+    return mp
 
 # ---------------- 先 TWSE → 再 TPEx、最多回補 N 天 ----------------
 
@@ -152,17 +214,18 @@ def get_close_price_for_code(code: str, target_date: datetime, max_backdays: int
         day = (target_date - timedelta(days=i)).astimezone(TPE_TZ)
         dkey = day.date().isoformat()
 
-        # 1) TWSE：該月月表
-        js = fetch_twse_month_json(code, day)
-        if js:
-            m = parse_twse_close_map(js)
-            if dkey in m:
-                return m[dkey], dkey
-
-        # 2) TPEx：該日整批 CSV（快取避免重抓）
-        if dkey not in tpex_cache:
-            df = fetch_tpex_daily_csv(day)
-            tpex_cache[dkey] = build_tpex_code_close_map(df) if df is not None else {}
+        # 1) TWSE：該月月表（同月快取）
+        try:
+            m = twse_month_close_map(code, day.year, day.month)
+        except Exception:
+            m = {}  # 暫時性失敗：本日改查 TPEx，下一個回補日會重新請求 TWSE
+        if dkey in m:
+            return m[dkey], dkey
+
+        # 2) TPEx：該日整批 CSV（記憶體 + 磁碟快取避免重抓）
+        with TPEX_LOCK:
+            if dkey not in tpex_cache:
+                tpex_cache[dkey] = load_tpex_close_map(day)
         mp = tpex_cache.get(dkey, {})
         if code in mp:
             return mp[code], dkey
@@ -171,7 +234,8 @@ def get_close_price_for_code(code: str, target_date: datetime, max_backdays: int
 
 # ---------------- 主流程：處理單一 CSV ----------------
 
-def process_csv(path: str, max_backdays: int, overwrite_same_day: bool) -> bool:
+def process_csv(path: str, max_backdays: int, overwrite_same_day: bool,
+                tpex_cache: Optional[Dict[str, Dict[str, float]]] = None) -> bool:
     # 讀檔
     df = pd.read_csv(path, dtype=str)
 
@@ -197,14 +261,18 @@ def process_csv(path: str, max_backdays: int, overwrite_same_day: bool) -> bool:
         df["收盤價"] = pd.NA
 
     codes = df[code_col].astype(str).map(_ensure_code).tolist()
-    tpex_cache: Dict[str, Dict[str, float]] = {}
+    if tpex_cache is None:
+        tpex_cache = {}
 
     print(f"[INFO] Processing {path} (target={rpt_dt.date().isoformat()})")
 
+    # 各代號彼此獨立：併發查價讓 TPEx/快取查詢與 TWSE 等待重疊（TWSE 本身仍逐一節流），結果依原順序寫回與輸出
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        results = list(ex.map(lambda c: get_close_price_for_code(c, rpt_dt, max_backdays, tpex_cache), codes))
+
     changed = False
-    for idx, code in enumerate(codes):
+    for idx, (code, (price, got_date)) in enumerate(zip(codes, results)):
         old_val = df.at[idx, "收盤價"]
-        price, got_date = get_close_price_for_code(code, rpt_dt, max_backdays, tpex_cache)
 
         if price is not None:
             # 同日覆蓋；其他情況：空值才填
@@ -226,11 +294,14 @@ def main():
     args = parse_args()
     csv_paths = _read_changed_list(args.csv_list_file)
     any_changed = False
+    # TPEx 每日收盤表以日期為鍵，跨檔共用（相鄰日期的回補區間大量重疊）
+    tpex_cache: Dict[str, Dict[str, float]] = {}
     for p in csv_paths:
         if not os.path.exists(p):
             print(f"[WARN] Not found: {p}")
             continue
-        chg = process_csv(p, max_backdays=args.max_backdays, overwrite_same_day=args.overwrite_same_day)
+        chg = process_csv(p, max_backdays=args.max_backdays, overwrite_same_day=args.overwrite_same_day,
+                          tpex_cache=tpex_cache)
         any_changed = any_changed or chg
     if not any_changed:
         print("[INFO] No CSV updated.")
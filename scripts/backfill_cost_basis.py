@@ -18,8 +18,10 @@ import argparse
 import glob
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 # 直接 import 同目錄下的 update_cost_basis 模組
@@ -28,24 +30,34 @@ from update_cost_basis import load_cost_basis, update_cost_basis
 
 
 REQUIRED_COLS = {"股票代號", "今日股數", "買賣超股數", "首次買進", "股票名稱", "今日收盤價"}
+DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
 
 
-def _load_change_table(path: Path) -> pd.DataFrame | None:
+def _read_change_table(path: Path) -> pd.DataFrame | Exception:
+    # 在背景執行緒跑：只讀檔，錯誤帶回主執行緒再印，log 順序不變
+    # 成本計算只用到 REQUIRED_COLS，其餘欄位（權重、昨日價…）解析時就略過
     try:
-        df = pd.read_csv(path, encoding="utf-8-sig", dtype=str)
-        df.columns = [str(c).replace("﻿", "").strip() for c in df.columns]
-        missing = REQUIRED_COLS - set(df.columns)
-        if missing:
-            print(f"[backfill] 跳過 {path.name}：缺少欄位 {missing}")
-            return None
-        return df
+        return pd.read_csv(path, encoding="utf-8-sig", dtype=str,
+                           usecols=lambda c: str(c).replace("﻿", "").strip() in REQUIRED_COLS)
     except Exception as e:
-        print(f"[backfill] 跳過 {path.name}：讀取錯誤 {e}")
+        return e
+
+
+def _load_change_table(path: Path, raw: pd.DataFrame | Exception) -> pd.DataFrame | None:
+    if isinstance(raw, Exception):
+        print(f"[backfill] 跳過 {path.name}：讀取錯誤 {raw}")
+        return None
+    df = raw
+    df.columns = [str(c).replace("﻿", "").strip() for c in df.columns]
+    missing = REQUIRED_COLS - set(df.columns)
+    if missing:
+        print(f"[backfill] 跳過 {path.name}：缺少欄位 {missing}")
         return None
+    return df
 
 
 def _extract_date(filename: str) -> str | None:
-    m = re.search(r"(\d{4}-\d{2}-\d{2})", filename)
+    m = DATE_RE.search(filename)
     return m.group(1) if m else None
 
 
@@ -84,23 +96,28 @@ def main() -> None:
             print(f"[backfill] --overwrite 模式：清除舊帳簿 {args.output}")
     else:
         cost_df = load_cost_basis(args.output)
-        # 找出已處理過的最後日期，從後面繼續
-        existing_dates = {_extract_date(Path(f).name) for _, f in dated if args.output.exists()}
         print(f"[backfill] 從現有帳簿繼續（已有 {len(cost_df)} 筆）")
 
     processed = 0
     skipped = 0
-    for date_str, fpath in dated:
-        change_df = _load_change_table(fpath)
-        if change_df is None:
-            skipped += 1
-            continue
-        cost_df = update_cost_basis(cost_df, change_df, date_str, args.gains_log)
-        processed += 1
-        print(f"[backfill] {date_str} 處理完成（持股數：{len(cost_df[cost_df['股數'].astype(str).str.strip() != '0'])}）")
+    # 讀檔交給執行緒池預先進行（pandas 解析時會釋放 GIL），成本計算仍依日期順序逐日累積
+    with ThreadPoolExecutor(max_workers=min(8, len(dated) or 1)) as ex:
+        raws = ex.map(_read_change_table, [f for _, f in dated])
+        for (date_str, fpath), raw in zip(dated, raws):
+            change_df = _load_change_table(fpath, raw)
+            if change_df is None:
+                skipped += 1
+                continue
+            # 逐日累積期間保留 股票代號 索引，不必每天重建
+            cost_df = update_cost_basis(cost_df, change_df, date_str, args.gains_log, keep_index=True)
+            processed += 1
+            # 持股數：股數在 update_cost_basis 內已是整數，直接在 ndarray 上計數（不走逐列字串轉換）
+            held = int(np.count_nonzero(cost_df["股數"].to_numpy() != 0))
+            print(f"[backfill] {date_str} 處理完成（持股數：{held}）")
 
     # 移除股數為 0 的紀錄（已完全清倉）
     args.output.parent.mkdir(parents=True, exist_ok=True)
+    cost_df = cost_df.reset_index(drop=True)
     cost_df["股數"] = pd.to_numeric(cost_df["股數"], errors="coerce").fillna(0)
     cost_df.to_csv(args.output, index=False, encoding="utf-8-sig")
 
@@ -4,16 +4,34 @@
 from __future__ import annotations
 
 import csv
+import hashlib
+import io
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # optional; fall back to the stdlib encoder
+    orjson = None
+
 SNAPSHOT_DIR = Path("data_snapshots")
 OUTPUT = Path("web/etf-tracker.json")
+# Parsed rows per snapshot, keyed by file name and validated by content hash.
+# Lives under the gitignored cache/ so the workflows' `git add -A` never picks it up.
+CACHE = Path("cache") / "site_parsed_rows.json"
 DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+CODE_RE = re.compile(r"([1-9]\d{3})")
 
 
 def number(value: str | None, default: float = 0) -> float:
+    # Plain decimals (most weight cells) parse directly; only fall back to
+    # stripping separators when the first attempt fails.
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
     try:
         return float(str(value or "").replace(",", "").replace("%", "").strip())
     except ValueError:
@@ -21,12 +39,16 @@ def number(value: str | None, default: float = 0) -> float:
 
 
 def read_snapshot(path: Path) -> list[dict]:
-    with path.open(encoding="utf-8-sig", newline="") as handle:
+    return parse_snapshot(path.read_bytes())
+
+
+def parse_snapshot(raw: bytes) -> list[dict]:
+    with io.StringIO(raw.decode("utf-8-sig"), newline="") as handle:
         reader = csv.DictReader(handle)
         rows = []
         for raw in reader:
             code = str(raw.get("股票代號") or raw.get("證券代號") or raw.get("代號") or "").strip()
-            match = re.search(r"([1-9]\d{3})", code)
+            match = CODE_RE.search(code)
             if not match:
                 continue
             rows.append({
@@ -41,6 +63,25 @@ def read_snapshot(path: Path) -> list[dict]:
     return rows
 
 
+def load_cache() -> dict:
+    try:
+        raw = CACHE.read_bytes()
+    except FileNotFoundError:
+        return {}
+    try:
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError:
+        return {}
+
+
+def save_cache(cache: dict) -> None:
+    CACHE.parent.mkdir(parents=True, exist_ok=True)
+    if orjson is not None:
+        CACHE.write_bytes(orjson.dumps(cache))
+    else:
+        CACHE.write_text(json.dumps(cache, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+
+
 def event_type(previous: dict | None, current: dict | None, delta_units: int, delta_weight: float) -> str:
     if previous is None and current is not None:
         return "新增持股"
@@ -65,9 +106,22 @@ def main() -> None:
     if len(files) < 2:
         raise SystemExit("At least two data_snapshots/YYYY-MM-DD.csv files are required")
 
-    snapshots: list[tuple[str, list[dict]]] = [
-        (path.stem, read_snapshot(path)) for path in files
-    ]
+    # Fetch every snapshot's bytes in one concurrent batch (the open/read
+    # syscalls overlap), then parse in order on the main thread.
+    with ThreadPoolExecutor(max_workers=min(8, len(files))) as pool:
+        blobs = list(pool.map(Path.read_bytes, files))
+    # Unchanged snapshots reuse their cached rows instead of being re-parsed.
+    cache = load_cache()
+    fresh: dict[str, dict] = {}
+    snapshots: list[tuple[str, list[dict]]] = []
+    for path, raw in zip(files, blobs):
+        digest = hashlib.sha1(raw).hexdigest()
+        entry = cache.get(path.name)
+        rows = entry["rows"] if entry and entry.get("sha1") == digest else parse_snapshot(raw)
+        fresh[path.name] = {"sha1": digest, "rows": rows}
+        snapshots.append((path.stem, rows))
+    if fresh != cache:
+        save_cache(fresh)
     maps = [(date, {row["code"]: row for row in rows}) for date, rows in snapshots]
     all_codes = sorted({code for _, rows in maps for code in rows})
     names: dict[str, str] = {}
@@ -93,15 +147,16 @@ def main() -> None:
                         "rank": row["rank"],
                     })
         if index:
-            for code, previous in previous_rows.items():
-                if code not in rows:
-                    events[code].append({
-                        "date": date,
-                        "type": "退出持股",
-                        "deltaUnits": -previous["units"],
-                        "deltaWeight": round(-previous["weight"], 6),
-                        "rank": None,
-                    })
+            # Exits are a key-set difference; no need to walk every prior holding.
+            for code in previous_rows.keys() - rows.keys():
+                previous = previous_rows[code]
+                events[code].append({
+                    "date": date,
+                    "type": "退出持股",
+                    "deltaUnits": -previous["units"],
+                    "deltaWeight": round(-previous["weight"], 6),
+                    "rank": None,
+                })
 
     latest_date, latest_map = maps[-1]
     previous_date, previous_map = maps[-2]
@@ -178,7 +233,10 @@ def main() -> None:
         "stats": stats,
     }
     OUTPUT.parent.mkdir(parents=True, exist_ok=True)
-    OUTPUT.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    if orjson is not None:
+        OUTPUT.write_bytes(orjson.dumps(payload))
+    else:
+        OUTPUT.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
     print(f"[site-data] wrote {OUTPUT} from {len(snapshots)} snapshots; latest={latest_date}")
 
 
@@ -83,15 +83,19 @@ def load_cost_basis(path: Path) -> pd.DataFrame:
     return pd.DataFrame(columns=["股票代號", "股票名稱", "股數", "成本市值"])
 
 
-def update_cost_basis(cost_df: pd.DataFrame, change_df: pd.DataFrame, report_date: str, gains_log_path: Path) -> pd.DataFrame:
+def update_cost_basis(cost_df: pd.DataFrame, change_df: pd.DataFrame, report_date: str, gains_log_path: Path,
+                      keep_index: bool = False) -> pd.DataFrame:
     """Update cost basis DataFrame using daily change information.
 
     Args:
-        cost_df: Existing cost basis DataFrame.
+        cost_df: Existing cost basis DataFrame.  May already be indexed on
+            ``股票代號`` (as returned with ``keep_index=True``).
         change_df: DataFrame of the daily change table.  Must contain
             ``股票代號``, ``股票名稱``, ``今日股數``, ``買賣超股數``, ``首次買進``, ``今日收盤價``.
         report_date: Date string of the change table.
         gains_log_path: Path to the realized gains log file.
+        keep_index: Return the frame still indexed on ``股票代號`` so that
+            callers applying many days in a row skip rebuilding the index.
 
     Returns:
         Updated DataFrame with new cost basis and share counts.
@@ -107,8 +111,9 @@ def update_cost_basis(cost_df: pd.DataFrame, change_df: pd.DataFrame, report_dat
         cost_df["股數"] = pd.to_numeric(cost_df["股數"], errors="coerce").fillna(0).astype(int)
         cost_df["成本市值"] = pd.to_numeric(cost_df["成本市值"], errors="coerce").fillna(0.0)
 
-    # Use index on 股票代號 for fast lookup
-    cost_df = cost_df.set_index("股票代號", drop=False)
+    # Use index on 股票代號 for fast lookup (reuse it if the caller kept it)
+    if cost_df.index.name != "股票代號":
+        cost_df = cost_df.set_index("股票代號", drop=False)
 
     for _, row in change_df.iterrows():
         code = str(row["股票代號"]).strip()
@@ -142,26 +147,27 @@ def update_cost_basis(cost_df: pd.DataFrame, change_df: pd.DataFrame, report_dat
                 }
             continue
 
-        # Stock already exists; update name if necessary
+        # Stock already exists; update name if necessary.
+        # Scalar cells go through .at, which skips .loc's label/indexer resolution.
         if name:
-            cost_df.loc[code, "股票名稱"] = name
+            cost_df.at[code, "股票名稱"] = name
 
         # If new shares purchased (positive), add to cost basis
         if new_shares > 0:
             if price_missing:
                 print(f"[warn] {code} ({report_date}) 今日收盤價缺失，買進 {new_shares} 股的成本無法計入，跳過")
             else:
-                existing_value = float(cost_df.loc[code, "成本市值"])
-                existing_shares = int(cost_df.loc[code, "股數"])
+                existing_value = float(cost_df.at[code, "成本市值"])
+                existing_shares = int(cost_df.at[code, "股數"])
                 updated_value = existing_value + new_shares * price
                 updated_shares = existing_shares + new_shares
-                cost_df.loc[code, "成本市值"] = updated_value
-                cost_df.loc[code, "股數"] = updated_shares
+                cost_df.at[code, "成本市值"] = updated_value
+                cost_df.at[code, "股數"] = updated_shares
 
         # If shares sold, apply moving average cost and log if fully cleared
         elif new_shares < 0:
-            existing_shares = int(cost_df.loc[code, "股數"])
-            existing_value = float(cost_df.loc[code, "成本市值"])
+            existing_shares = int(cost_df.at[code, "股數"])
+            existing_value = float(cost_df.at[code, "成本市值"])
 
             sell_shares = abs(new_shares)
             actual_sell_shares = min(sell_shares, existing_shares)
@@ -172,8 +178,8 @@ def update_cost_basis(cost_df: pd.DataFrame, change_df: pd.DataFrame, report_dat
             deducted_cost = actual_sell_shares * avg_unit_cost
             updated_value = max(0.0, existing_value - deducted_cost)
 
-            cost_df.loc[code, "股數"] = updated_shares
-            cost_df.loc[code, "成本市值"] = updated_value
+            cost_df.at[code, "股數"] = updated_shares
+            cost_df.at[code, "成本市值"] = updated_value
 
             # Log realized gains if fully cleared (only when price is available)
             if updated_shares == 0 and actual_sell_shares > 0:
@@ -196,7 +202,7 @@ def update_cost_basis(cost_df: pd.DataFrame, change_df: pd.DataFrame, report_dat
                         "報酬率": round(roi, 4)
                     }
                     _log_realized_gains(record, gains_log_path)
-    return cost_df.reset_index(drop=True)
+    return cost_df if keep_index else cost_df.reset_index(drop=True)
 
 
 def main() -> None:
@@ -8,7 +8,6 @@
 # - 主送 SMTP（Gmail），失敗則自動改用 SendGrid API
 
 import os
-import glob
 import smtplib
 import ssl
 from pathlib import Path
@@ -17,31 +16,7 @@ from email.mime.text import MIMEText
 
 import pandas as pd
 
-
-# -------------------- 共用：日期/檔案 --------------------
-def get_report_date() -> str:
-    """優先讀 manifest/effective_date.txt，其次讀環境變數 REPORT_DATE。"""
-    m = Path("manifest/effective_date.txt")
-    if m.exists():
-        d = m.read_text(encoding="utf-8").strip()
-        if d:
-            return d
-    d = (os.getenv("REPORT_DATE") or "").strip()
-    if len(d) == 8 and d.isdigit():
-        return f"{d[:4]}-{d[4:6]}-{d[6:]}"
-    return d
-
-
-def find_prev_snapshot(report_date: str) -> str:
-    """回傳 data_snapshots 中 < report_date 的最後一筆日期（YYYY-MM-DD）。找不到回傳空字串。"""
-    snaps = sorted(glob.glob("data_snapshots/*.csv"))
-    prev = ""
-    for p in reversed(snaps):
-        name = Path(p).stem
-        if name < report_date:
-            prev = name
-            break
-    return prev
+from utils import find_prev_snapshot, get_report_date
 
 
 def human_int(x) -> str:
@@ -72,7 +47,7 @@ def _build_cost_basis_section(report_date: str, price_map: dict) -> str:
         df["股數"] = pd.to_numeric(df.get("股數", 0), errors="coerce").fillna(0).astype(int)
         df["成本市值"] = pd.to_numeric(df["成本市值"], errors="coerce").fillna(0.0)
         # 只顯示仍持有的股票（股數 > 0）
-        df = df[df["股數"] > 0].copy()
+        df = df[df["股數"] > 0]  # 之後只排序、讀取，不回寫欄位，免整表複製
         if df.empty:
             return ""
     except Exception:
@@ -82,15 +57,17 @@ def _build_cost_basis_section(report_date: str, price_map: dict) -> str:
     total_cost = 0.0
     total_market = 0.0
 
-    for _, r in df.sort_values("成本市值", ascending=False).iterrows():
-        code = str(r.get("股票代號", ""))
-        name = str(r.get("股票名稱", ""))
-        shares = int(r["股數"])
-        cost_val = float(r["成本市值"])
+    df = df.sort_values("成本市值", ascending=False)
+    codes = df["股票代號"].astype(str)
+    names = df["股票名稱"].astype(str) if "股票名稱" in df.columns else pd.Series("", index=df.index)
+    # 價格一次對照整欄（查無為 NaN，下方 > 0 判斷自然落到「—」）
+    prices = codes.map(price_map)
+
+    for code, name, shares, cost_val, price in zip(codes, names, df["股數"], df["成本市值"].astype(float), prices):
+        shares = int(shares)
         avg_cost = cost_val / shares if shares > 0 else 0.0
 
-        price = price_map.get(code)
-        if price is not None and price > 0:
+        if price > 0:
             market_val = price * shares
             pnl = market_val - cost_val
             roi = pnl / cost_val if cost_val > 0 else 0.0
@@ -174,9 +151,10 @@ def build_html(report_date: str) -> str:
                     break
             if price_col is None:
                 price_col = pf.columns[1] if len(pf.columns) > 1 else pf.columns[0]
-            for _, row in pf.iterrows():
-                code = str(row[code_col]).strip()
-                val = str(row[price_col]).strip()
+            # 兩欄先整欄轉字串，再 zip 走訪（不用 iterrows 逐列建 Series）
+            codes = pf[code_col].astype(str).str.strip()
+            vals = pf[price_col].astype(str).str.strip()
+            for code, val in zip(codes, vals):
                 if val:
                     try:
                         price_map[code] = float(val)
@@ -209,11 +187,12 @@ def build_html(report_date: str) -> str:
 
     # 摘要資料（前十大權重、最大權重）
     top10_sum = df_sorted["今日權重%"].nlargest(10).sum()
-    max_row = df_sorted.nlargest(1, "今日權重%")
-    if not max_row.empty:
-        max_code = str(max_row.iloc[0]["股票代號"])
-        max_name = str(max_row.iloc[0].get("股票名稱", ""))
-        max_weight = float(max_row.iloc[0]["今日權重%"])
+    # 只要最大的一筆：idxmax 單趟掃描即可，不必做 top-k 選取
+    if not df_sorted.empty:
+        max_row = df_sorted.loc[df_sorted["今日權重%"].idxmax()]
+        max_code = str(max_row["股票代號"])
+        max_name = str(max_row.get("股票名稱", ""))
+        max_weight = float(max_row["今日權重%"])
         max_text = f"{max_code} {max_name}（{max_weight:.2f}%）"
     else:
         max_text = "—"
@@ -226,9 +205,10 @@ def build_html(report_date: str) -> str:
     def list_codes_names(sub: pd.DataFrame) -> str:
         if sub.empty:
             return "無"
-        items = [f"{str(r['股票代號'])} {str(r.get('股票名稱',''))}".strip()
-                 for _, r in sub.sort_values("今日權重%", ascending=False).iterrows()]
-        return "、".join(items)
+        sub = sub.sort_values("今日權重%", ascending=False)
+        names = sub["股票名稱"].astype(str) if "股票名稱" in sub.columns else ""
+        items = (sub["股票代號"].astype(str) + " " + names).str.strip()
+        return "、".join(items.tolist())
 
     first_buys_str = list_codes_names(first_buys)
     heavy_trim_str = list_codes_names(heavy_trim)
@@ -259,33 +239,33 @@ def build_html(report_date: str) -> str:
     """
 
     # 表格列（新增「買賣超股數」欄位，並以正負色彩標示）
-    rows = []
-    for _, r in df_sorted.iterrows():
-        code = str(r.get("股票代號", ""))
-        name = str(r.get("股票名稱", ""))
-        # 讀取此股票當天收盤價（若有）
-        # 優先從 price_map 取得收盤價；若無則回退至 change_table 的「今日收盤價」欄位
+    # 逐欄先備好，再 zip 走訪（不用 iterrows 每列建 Series）
+    codes = df_sorted["股票代號"].astype(str)
+    names = df_sorted["股票名稱"].astype(str) if "股票名稱" in df_sorted.columns else pd.Series("", index=df_sorted.index)
+    # 收盤價：優先 price_map；代號不在 price_map 時回退至 change_table 的「今日收盤價」欄位
+    if "今日收盤價" in df_sorted.columns:
+        fallback = pd.to_numeric(df_sorted["今日收盤價"], errors="coerce")
+    else:
+        fallback = pd.Series(float("nan"), index=df_sorted.index)
+    closes = []
+    for code, fb in zip(codes, fallback):
         price_val = price_map.get(code)
-        if price_val is None:
-            # fallback: 試讀 change_table 中的「今日收盤價」欄位
-            try:
-                val = r.get("今日收盤價", None)
-                # 如果值存在且非缺失，嘗試轉為 float
-                if val not in (None, "") and not pd.isna(val):
-                    price_val = float(val)
-            except Exception:
-                price_val = None
-        if price_val is not None:
-            close = f"{price_val:.2f}"
-        else:
-            close = ""
-        s_t = human_int(r["今日股數"])
-        s_y = human_int(r["昨日股數"])
-        w_t = f"{human_float(r['今日權重%']):s}%"
-        w_y = f"{human_float(r['昨日權重%']):s}%"
-        delta_shares = int(r["買賣超股數"])
+        if price_val is None and not pd.isna(fb):
+            price_val = float(fb)
+        closes.append(f"{price_val:.2f}" if price_val is not None else "")
+
+    rows = []
+    for code, name, close, sh_t, sh_y, pw_t, pw_y, delta_shares, dlt in zip(
+        codes, names, closes,
+        df_sorted["今日股數"], df_sorted["昨日股數"],
+        df_sorted["今日權重%"], df_sorted["昨日權重%"],
+        df_sorted["買賣超股數"].astype(int), df_sorted["權重Δ%"].astype(float),
+    ):
+        s_t = human_int(sh_t)
+        s_y = human_int(sh_y)
+        w_t = f"{human_float(pw_t):s}%"
+        w_y = f"{human_float(pw_y):s}%"
         delta_shares_s = f"{delta_shares:+,}"
-        dlt = float(r["權重Δ%"])
         dlt_s = f"{dlt:+.2f}%"
         cls_sh = "pos" if delta_shares > 0 else "neg" if delta_shares < 0 else ""
         cls_w  = "pos" if dlt > 0 else "neg" if dlt < 0 else ""
@@ -1,4 +1,11 @@
+import glob
+import os
+from pathlib import Path
+
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 def standardize_columns(df, columns_types):
@@ -39,3 +46,48 @@ def standardize_columns(df, columns_types):
                 df[col] = pd.to_numeric(df[col], errors='coerce')
     
     return df
+
+
+# -------------------- 共用：日期/檔案（charts.py / send_email.py） --------------------
+def get_report_date() -> str:
+    """優先讀 manifest/effective_date.txt，其次讀環境變數 REPORT_DATE。"""
+    m = Path("manifest/effective_date.txt")
+    if m.exists():
+        d = m.read_text(encoding="utf-8").strip()
+        if d:
+            return d
+    d = (os.getenv("REPORT_DATE") or "").strip()
+    if len(d) == 8 and d.isdigit():
+        return f"{d[:4]}-{d[4:6]}-{d[6:]}"
+    return d
+
+
+def find_prev_snapshot(report_date: str) -> str:
+    """回傳 data_snapshots 中 < report_date 的最後一筆日期（YYYY-MM-DD）。找不到回傳空字串。"""
+    snaps = sorted(glob.glob("data_snapshots/*.csv"))
+    prev = ""
+    for p in reversed(snaps):
+        name = Path(p).stem
+        if name < report_date:
+            prev = name
+            break
+    return prev
+
+
+# -------------------- 共用：整列文字（build_change_table.py / fetch_snapshot.py） --------------------
+def row_text(df: pd.DataFrame) -> pd.Series:
+    """整列文字串接（缺值當空字串），供找不到代號欄時從整列抽代號。逐欄向量化 str.cat，不逐列 join。"""
+    t = df.astype(str)
+    return t.iloc[:, 0].str.cat(t.iloc[:, 1:], sep=" ", na_rep="")
+
+
+# -------------------- 共用：HTTP Session（etf_tracker.py / build_prices.py / fill_stocks_close_price.py） --------------------
+def make_session(headers=None, pool_maxsize=16) -> requests.Session:
+    """模組層共用 Session：連線池重用 TCP/TLS 連線，暫時性錯誤（429/5xx）對 GET 自動退避重試。
+    scripts/add_close_prices_tw.py 無法 import 本檔，另以相同重試策略建立，調整時兩邊一起改。"""
+    s = requests.Session()
+    if headers:
+        s.headers.update(headers)
+    s.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=Retry(
+        total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])))
+    return s
@@ -4,12 +4,14 @@ from pathlib import Path
 
 ARCHIVE = Path("archive")
 DATA    = Path("data"); DATA.mkdir(exist_ok=True)
+ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+YMD_RE      = re.compile(r"\d{8}")
 
 def norm_date(raw: str) -> str:
     raw = (raw or "").strip()
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", raw):
+    if ISO_DATE_RE.fullmatch(raw):
         return raw
-    if re.fullmatch(r"\d{8}", raw):
+    if YMD_RE.fullmatch(raw):
         return f"{raw[:4]}-{raw[4:6]}-{raw[6:]}"
     # 預設用今天（runner 時區由 workflow 設為 Asia/Taipei）
     return pd.Timestamp("today").strftime("%Y-%m-%d")
@@ -23,12 +25,10 @@ def load_holdings_from_xlsx(date_str: str) -> pd.DataFrame:
         raise SystemExit(f"找不到當日 Xlsx：{month_dir}/*{yyyymmdd}*.xlsx")
     fp = cands[-1]
 
-    # 優先讀 holdings，沒有就讀第一張
-    try:
-        df = pd.read_excel(fp, sheet_name="holdings", dtype={"股票代號": str})
-    except Exception:
-        xl = pd.ExcelFile(fp)
-        df = pd.read_excel(xl, sheet_name=xl.sheet_names[0], dtype={"股票代號": str})
+    # 優先讀 holdings，沒有就讀第一張（活頁簿只開一次）
+    with pd.ExcelFile(fp) as xl:
+        sheet = "holdings" if "holdings" in xl.sheet_names else xl.sheet_names[0]
+        df = xl.parse(sheet_name=sheet, dtype={"股票代號": str})
 
     # 欄位正規化
     rename = {